@@ -0,0 +1,162 @@
+"""Admission control in front of the API.
+
+``AdmissionMiddleware`` decides, before any handler runs, whether a request
+gets in:
+
+- Rate limits: token buckets per client (the authenticated user at an
+  address, or the address alone for anonymous requests such as login), one
+  over all of the client's requests and one per route. An empty bucket
+  answers 429 with ``Retry-After`` set to when the next token arrives.
+- Load shedding: routes classified as expensive (lists, dashboard, reports,
+  uploads, PDFs) share ``max_concurrent`` slots. A request waits at most
+  ``queue_timeout`` seconds for one, behind at most ``max_queue`` others,
+  and otherwise gets 503 with ``Retry-After`` instead of adding latency to
+  everything queued.
+
+Which client and which route a request belongs to is decided by the
+``identify`` and ``classify`` callables, so this module knows nothing about
+tokens or paths.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+
+class TokenBuckets:
+    """One bucket of ``burst`` tokens refilled at ``rate`` per second per key; idle keys are forgotten."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, updated at)
+        self._buckets: OrderedDict = OrderedDict()
+
+    def take(self, key) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        # A forgotten key starts again with a full bucket, as it would after idling
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimit:
+    def __init__(self, max_concurrent: int, queue_timeout: float, max_queue: int):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self) -> bool:
+        """Takes a slot, waiting up to ``queue_timeout``; False if the request should be shed."""
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.running += 1
+        return True
+
+    def release(self):
+        self.running -= 1
+        self._slots.release()
+
+
+class Admission:
+    """The limits and their counters; ``classify(method, path)`` returns (route, limits or None, expensive),
+    or None for requests that are never limited."""
+
+    def __init__(self, identify: Callable[[dict], str], classify: Callable[[str, str], Optional[Tuple]],
+                 client_limits: Tuple[float, float], route_limits: Tuple[float, float],
+                 max_concurrent: int, queue_timeout: float, max_queue: int, shed_retry_after: int = 1):
+        self.identify = identify
+        self.classify = classify
+        self.clients = TokenBuckets(*client_limits)
+        self.route_limits = route_limits
+        self.routes: Dict[Tuple[float, float], TokenBuckets] = {}
+        self.expensive = ConcurrencyLimit(max_concurrent, queue_timeout, max_queue)
+        self.shed_retry_after = shed_retry_after
+        self.limited: Counter = Counter()
+        self.shed: Counter = Counter()
+
+    def take(self, scope, route: str, limits: Optional[Tuple[float, float]]) -> float:
+        limits = limits or self.route_limits
+        if limits not in self.routes:
+            self.routes[limits] = TokenBuckets(*limits)
+        client = self.identify(scope)
+        wait = max(self.clients.take(client), self.routes[limits].take((client, route)))
+        if wait:
+            self.limited[route] += 1
+        return wait
+
+    def metrics(self) -> dict:
+        return {
+            'em_execucao': self.expensive.running,
+            'na_fila': self.expensive.waiting,
+            'limite_concorrencia': self.expensive.max_concurrent,
+            'limitadas': dict(self.limited),
+            'descartadas': dict(self.shed),
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        classified = self.admission.classify(scope['method'], scope['path'])
+        if classified is None:
+            return await self.app(scope, receive, send)
+        route, limits, expensive = classified
+        wait = self.admission.take(scope, route, limits)
+        if wait:
+            return await reject(send, 429, "Muitas requisições; tente novamente em instantes", math.ceil(wait))
+        if not expensive:
+            return await self.app(scope, receive, send)
+        slots = self.admission.expensive
+        if not await slots.acquire():
+            self.admission.shed[route] += 1
+            return await reject(send, 503, "Servidor sobrecarregado; tente novamente em instantes",
+                                self.admission.shed_retry_after)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            slots.release()
+
+
+async def reject(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({'detail': detail}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(max(retry_after, 1)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,235 @@
+"""Per-dress and per-group (categoria/tamanho) rental aggregates.
+
+``vestido_stats`` and ``grupo_stats`` are maintained incrementally by the
+write handlers in server.py, in the same transaction as the rental or dress
+change, so ranking queries never scan ``alugueis``. ``rebuild`` recomputes
+everything from scratch and runs periodically from the scheduler to correct
+any drift (e.g. rows edited outside the API).
+
+Revenue is ``valor_pago``, the money actually received, matching the
+dashboard. Occupancy, rentals per month and idle days are derived at query
+time from the stored totals and timestamps. Groups only count current
+dresses: deleting a dress takes its rentals out of its groups too.
+"""
+import time
+
+DIA = 24 * 3600
+# Average month length, for rentals-per-month
+MES = 30.44 * DIA
+DIMENSOES = ('categoria', 'tamanho')
+
+# Query-time metrics; every name here can be used as a ranking order
+METRICAS_VESTIDO = {
+    'receita': 's.receita',
+    'alugueis': 's.total_alugueis',
+    'dias_alugados': 's.dias_alugados',
+    'ocupacao': 'MIN(1.0, s.dias_alugados * 1.0 / MAX(1, (:agora - s.cadastro_ts) / 86400.0))',
+    'alugueis_por_mes': f's.total_alugueis * 1.0 / MAX(1, (:agora - s.cadastro_ts) / {MES})',
+    'dias_ocioso': 'MAX(0, :agora - COALESCE(s.ultima_devolucao_ts, s.cadastro_ts)) / 86400',
+}
+METRICAS_GRUPO = {
+    'receita': 'receita',
+    'alugueis': 'total_alugueis',
+    'dias_alugados': 'dias_alugados',
+    'vestidos': 'vestidos',
+    'receita_por_vestido': 'receita * 1.0 / MAX(1, vestidos)',
+}
+
+
+def dias_aluguel(retirada_ts, devolucao_ts) -> int:
+    """Days a rental occupies the dress, counting partial days, at least one."""
+    if retirada_ts is None or devolucao_ts is None:
+        return 0
+    return max(1, -(-(devolucao_ts - retirada_ts) // DIA))
+
+
+async def create_tables(db, alugueis: str = 'alugueis'):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS vestido_stats (
+            vestido_id TEXT PRIMARY KEY,
+            total_alugueis INTEGER DEFAULT 0,
+            receita REAL DEFAULT 0,
+            dias_alugados INTEGER DEFAULT 0,
+            cadastro_ts INTEGER,
+            ultima_devolucao_ts INTEGER
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_vestido_stats_receita ON vestido_stats(receita)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_vestido_stats_alugueis ON vestido_stats(total_alugueis)")
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS grupo_stats (
+            dimensao TEXT,
+            valor TEXT,
+            vestidos INTEGER DEFAULT 0,
+            total_alugueis INTEGER DEFAULT 0,
+            receita REAL DEFAULT 0,
+            dias_alugados INTEGER DEFAULT 0,
+            PRIMARY KEY (dimensao, valor)
+        )
+    ''')
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM vestido_stats), EXISTS (SELECT 1 FROM vestidos)")
+    has_stats, has_vestidos = await cursor.fetchone()
+    if has_vestidos and not has_stats:
+        await rebuild(db, alugueis)
+
+
+async def rebuild(db, alugueis: str = 'alugueis'):
+    """Recomputes all aggregates from vestidos/alugueis in one transaction.
+
+    ``alugueis`` may be a subquery, so archived rentals keep being counted.
+    """
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await db.execute("DELETE FROM vestido_stats")
+        await db.execute(f'''
+            INSERT INTO vestido_stats (vestido_id, total_alugueis, receita, dias_alugados, cadastro_ts, ultima_devolucao_ts)
+            SELECT v.id, COUNT(a.id), COALESCE(SUM(a.valor_pago), 0),
+                   COALESCE(SUM(MAX(1, (a.data_devolucao_ts - a.data_retirada_ts + 86399) / 86400)), 0),
+                   CAST(strftime('%s', v.created_at) AS INTEGER), MAX(a.data_devolucao_ts)
+            FROM vestidos v
+            LEFT JOIN {alugueis} a ON a.vestido_id = v.id
+            GROUP BY v.id
+        ''')
+        await db.execute("DELETE FROM grupo_stats")
+        for dimensao in DIMENSOES:
+            # Rentals of deleted dresses have no group left, as in on_vestido_deleted
+            await db.execute(f'''
+                INSERT INTO grupo_stats (dimensao, valor, vestidos, total_alugueis, receita, dias_alugados)
+                SELECT ?, v.{dimensao}, COUNT(*), SUM(s.total_alugueis), SUM(s.receita), SUM(s.dias_alugados)
+                FROM vestidos v
+                JOIN vestido_stats s ON s.vestido_id = v.id
+                GROUP BY v.{dimensao}
+            ''', (dimensao,))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+
+async def _upsert_grupo(db, dimensao: str, valor, vestidos=0, alugueis=0, receita=0.0, dias=0):
+    await db.execute(
+        '''INSERT INTO grupo_stats (dimensao, valor, vestidos, total_alugueis, receita, dias_alugados)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(dimensao, valor) DO UPDATE SET
+               vestidos = grupo_stats.vestidos + excluded.vestidos,
+               total_alugueis = grupo_stats.total_alugueis + excluded.total_alugueis,
+               receita = grupo_stats.receita + excluded.receita,
+               dias_alugados = grupo_stats.dias_alugados + excluded.dias_alugados''',
+        (dimensao, valor, vestidos, alugueis, receita, dias)
+    )
+
+
+async def _update_grupos(db, grupos: dict, **deltas):
+    for dimensao in DIMENSOES:
+        await _upsert_grupo(db, dimensao, grupos[dimensao], **deltas)
+
+
+async def _grupos_of(db, vestido_id: str):
+    cursor = await db.execute("SELECT categoria, tamanho FROM vestidos WHERE id = ?", (vestido_id,))
+    row = await cursor.fetchone()
+    return {'categoria': row[0], 'tamanho': row[1]} if row else None
+
+
+async def on_vestido_created(db, vestido_id: str, categoria: str, tamanho: str, cadastro_ts: int):
+    await db.execute(
+        "INSERT OR IGNORE INTO vestido_stats (vestido_id, cadastro_ts) VALUES (?, ?)",
+        (vestido_id, cadastro_ts)
+    )
+    await _update_grupos(db, {'categoria': categoria, 'tamanho': tamanho}, vestidos=1)
+
+
+async def _totais(db, vestido_id: str):
+    cursor = await db.execute(
+        "SELECT total_alugueis, receita, dias_alugados FROM vestido_stats WHERE vestido_id = ?", (vestido_id,)
+    )
+    row = await cursor.fetchone()
+    return tuple(row) if row else (0, 0.0, 0)
+
+
+async def on_vestido_deleted(db, vestido_id: str, grupos: dict):
+    """Call before deleting the row. The dress's rentals leave its groups with it, as in ``rebuild``."""
+    alugueis, receita, dias = await _totais(db, vestido_id)
+    await db.execute("DELETE FROM vestido_stats WHERE vestido_id = ?", (vestido_id,))
+    await _update_grupos(db, grupos, vestidos=-1, alugueis=-alugueis, receita=-receita, dias=-dias)
+
+
+async def on_vestido_regrouped(db, vestido_id: str, antes: dict, depois: dict):
+    """Moves a dress's totals between groups after its categoria/tamanho changed."""
+    alugueis, receita, dias = await _totais(db, vestido_id)
+    for dimensao in DIMENSOES:
+        if antes[dimensao] == depois[dimensao]:
+            continue
+        for valor, sinal in ((antes[dimensao], -1), (depois[dimensao], 1)):
+            await _upsert_grupo(db, dimensao, valor, vestidos=sinal, alugueis=sinal * alugueis,
+                                receita=sinal * receita, dias=sinal * dias)
+
+
+async def on_aluguel(db, vestido_id: str, retirada_ts, devolucao_ts, valor_pago: float, sinal: int = 1):
+    """Adds (sinal=1) or removes (sinal=-1, after deleting the row) one rental from the aggregates.
+
+    On removal the last return is found again among the remaining live
+    rentals; archived ones are only seen again by ``rebuild``.
+    """
+    grupos = await _grupos_of(db, vestido_id)
+    if not grupos:
+        return
+    dias = dias_aluguel(retirada_ts, devolucao_ts)
+    await db.execute(
+        '''UPDATE vestido_stats SET
+               total_alugueis = total_alugueis + ?,
+               receita = receita + ?,
+               dias_alugados = dias_alugados + ?,
+               ultima_devolucao_ts = CASE WHEN ? > 0 THEN MAX(COALESCE(ultima_devolucao_ts, 0), ?)
+                   ELSE (SELECT MAX(data_devolucao_ts) FROM alugueis WHERE vestido_id = ?) END
+           WHERE vestido_id = ?''',
+        (sinal, sinal * (valor_pago or 0), sinal * dias, sinal, devolucao_ts or 0, vestido_id, vestido_id)
+    )
+    await _update_grupos(db, grupos, alugueis=sinal, receita=sinal * (valor_pago or 0), dias=sinal * dias)
+
+
+async def on_pagamento(db, vestido_id: str, delta: float):
+    """Records a change in a rental's valor_pago."""
+    if not delta:
+        return
+    grupos = await _grupos_of(db, vestido_id)
+    if not grupos:
+        return
+    await db.execute("UPDATE vestido_stats SET receita = receita + ? WHERE vestido_id = ?", (delta, vestido_id))
+    await _update_grupos(db, grupos, receita=delta)
+
+
+async def rank_vestidos(db, ordem: str, crescente: bool, limite: int, categoria=None, tamanho=None) -> list:
+    sql = f'''
+        SELECT v.id AS vestido_id, v.nome, v.codigo, v.categoria, v.tamanho, v.status,
+               s.total_alugueis, s.receita, s.dias_alugados,
+               {METRICAS_VESTIDO['ocupacao']} AS ocupacao,
+               {METRICAS_VESTIDO['alugueis_por_mes']} AS alugueis_por_mes,
+               CASE WHEN v.status = 'alugado' THEN 0 ELSE {METRICAS_VESTIDO['dias_ocioso']} END AS dias_ocioso
+        FROM vestido_stats s
+        JOIN vestidos v ON v.id = s.vestido_id
+        WHERE 1=1
+    '''
+    params = {'agora': int(time.time()), 'limite': limite}
+    if categoria:
+        sql += " AND v.categoria = :categoria"
+        params['categoria'] = categoria
+    if tamanho:
+        sql += " AND v.tamanho = :tamanho"
+        params['tamanho'] = tamanho
+    order = ordem if ordem in ('ocupacao', 'alugueis_por_mes', 'dias_ocioso') else METRICAS_VESTIDO[ordem]
+    sql += f" ORDER BY {order} {'ASC' if crescente else 'DESC'}, v.id LIMIT :limite"
+    cursor = await db.execute(sql, params)
+    return [dict(row) for row in await cursor.fetchall()]
+
+
+async def rank_grupos(db, dimensao: str, ordem: str, crescente: bool, limite: int) -> list:
+    cursor = await db.execute(
+        f'''SELECT valor, vestidos, total_alugueis, receita, dias_alugados,
+                   {METRICAS_GRUPO['receita_por_vestido']} AS receita_por_vestido
+            FROM grupo_stats
+            WHERE dimensao = ? AND (vestidos > 0 OR total_alugueis > 0)
+            ORDER BY {METRICAS_GRUPO[ordem]} {'ASC' if crescente else 'DESC'}, valor
+            LIMIT ?''',
+        (dimensao, limite)
+    )
+    return [dict(row) for row in await cursor.fetchall()]
@@ -0,0 +1,98 @@
+"""Archival of old finished rentals into a separate SQLite file.
+
+``archive_alugueis`` moves ``finalizado`` rentals returned before a cutoff
+from ``alugueis`` into the same table of an archive database, ATTACHed as
+``arquivo``. The hot table then only holds recent and active rentals, which
+keeps list/dashboard scans and VACUUM of the main database cheap.
+
+Each chunk is copied and committed first and only then deleted from the hot
+table, in a second transaction: transactions spanning attached databases
+are not atomic under WAL, and this order can at worst leave a row in both
+files (cleaned up by the next run), never in neither.
+
+Readers that want old data call ``attach`` and select from
+``alugueis_union(columns)`` instead of ``alugueis``.
+"""
+import os
+from pathlib import Path
+from typing import List
+
+SCHEMA = 'arquivo'
+
+
+async def attach(db, path: Path):
+    """ATTACHes the archive file as ``arquivo``, creating its table on first use.
+
+    Must be called outside a transaction.
+    """
+    cursor = await db.execute("PRAGMA database_list")
+    if any(row[1] == SCHEMA for row in await cursor.fetchall()):
+        return
+    await db.execute("ATTACH DATABASE ? AS arquivo", (os.fspath(path),))
+    await ensure_schema(db)
+
+
+async def hot_columns(db) -> List[str]:
+    cursor = await db.execute("PRAGMA main.table_info(alugueis)")
+    return [row[1] for row in await cursor.fetchall()]
+
+
+async def ensure_schema(db):
+    """Mirrors the columns of main.alugueis, including ones added by later migrations."""
+    cursor = await db.execute("PRAGMA main.table_info(alugueis)")
+    columns = await cursor.fetchall()
+    definitions = ', '.join(
+        f"{name} {type_}{' PRIMARY KEY' if pk else ''}" for _, name, type_, _, _, pk in columns
+    )
+    await db.execute(f"CREATE TABLE IF NOT EXISTS arquivo.alugueis ({definitions})")
+    cursor = await db.execute("PRAGMA arquivo.table_info(alugueis)")
+    existing = {row[1] for row in await cursor.fetchall()}
+    for _, name, type_, _, _, _ in columns:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE arquivo.alugueis ADD COLUMN {name} {type_}")
+    await db.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_vestido ON alugueis(vestido_id, created_at_ts)")
+    await db.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_cliente ON alugueis(cliente_id, created_at_ts)")
+    await db.commit()
+
+
+def alugueis_union(columns: List[str]) -> str:
+    """FROM-clause source covering hot and archived rentals; needs ``attach`` first."""
+    cols = ', '.join(columns)
+    return f"(SELECT {cols} FROM main.alugueis UNION ALL SELECT {cols} FROM arquivo.alugueis)"
+
+
+async def archive_alugueis(db, path: Path, cutoff_ts: int, chunk: int = 500) -> int:
+    """Moves finished rentals returned before ``cutoff_ts`` to the archive; returns how many."""
+    cursor = await db.execute(
+        "SELECT EXISTS (SELECT 1 FROM main.alugueis WHERE status = 'finalizado' AND data_devolucao_ts < ?)",
+        (cutoff_ts,)
+    )
+    if not (await cursor.fetchone())[0]:
+        return 0
+    await attach(db, path)
+    columns = ', '.join(await hot_columns(db))
+    moved = 0
+    while True:
+        cursor = await db.execute(
+            '''SELECT id FROM main.alugueis
+               WHERE status = 'finalizado' AND data_devolucao_ts < ?
+               LIMIT ?''',
+            (cutoff_ts, chunk)
+        )
+        ids = [row[0] for row in await cursor.fetchall()]
+        if not ids:
+            break
+        placeholders = ', '.join('?' * len(ids))
+        await db.execute(
+            f"INSERT OR REPLACE INTO arquivo.alugueis ({columns}) SELECT {columns} FROM main.alugueis WHERE id IN ({placeholders})",
+            ids
+        )
+        await db.commit()
+        await db.execute(
+            f'''DELETE FROM main.alugueis WHERE id IN ({placeholders})
+                AND id IN (SELECT id FROM arquivo.alugueis WHERE id IN ({placeholders}))''',
+            ids + ids
+        )
+        await db.commit()
+        moved += len(ids)
+    return moved
@@ -0,0 +1,222 @@
+"""Online backups of the SQLite database.
+
+Backups use SQLite's backup API a few pages at a time, sleeping between
+steps, so the app keeps serving requests while one runs. Each backup is
+checked with ``PRAGMA quick_check``, gzip-compressed into ``backups_dir``
+and older files beyond ``keep`` are rotated out.
+
+Point-in-time restore works at snapshot granularity: ``restaurar --ate``
+picks the newest backup taken at or before the given time, so the restore
+point is bounded by the backup interval.
+
+    cd backend
+    python backup.py criar
+    python backup.py listar
+    python backup.py restaurar backups/database-20260101T030000Z.db.gz
+    python backup.py restaurar --ate 2026-01-01T12:00:00
+
+Restore replaces the database file, so stop the app first.
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+PAGES_PER_STEP = 256
+STEP_SLEEP_SECONDS = 0.005
+# After this many restarts caused by concurrent writes, copy in a single step
+MAX_RESTARTS = 3
+PREFIX = 'database-'
+SUFFIX = '.db.gz'
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_name(when: datetime) -> str:
+    return f"{PREFIX}{when.strftime(TIMESTAMP_FORMAT)}{SUFFIX}"
+
+
+def backup_time(path: Path) -> Optional[datetime]:
+    stamp = path.name[len(PREFIX):-len(SUFFIX)]
+    try:
+        return datetime.strptime(stamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def list_backups(backups_dir: Path) -> List[Path]:
+    """Backup files, oldest first."""
+    if not backups_dir.is_dir():
+        return []
+    files = [p for p in backups_dir.glob(f"{PREFIX}*{SUFFIX}") if backup_time(p)]
+    return sorted(files, key=backup_time)
+
+
+def copy_database(source: Path, target: Path, pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP_SECONDS) -> dict:
+    """Copies ``source`` into ``target`` with the online backup API.
+
+    The source is only locked while a step copies its pages, so writers
+    proceed between steps. A write from another connection makes SQLite
+    restart the copy; after MAX_RESTARTS the rest is done in one step,
+    which under WAL still does not block writers.
+    """
+    stats = {'passos': 0, 'reinicios': 0}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['passos'] += 1
+        if last_remaining is not None and remaining > last_remaining:
+            stats['reinicios'] += 1
+            if stats['reinicios'] >= MAX_RESTARTS:
+                raise _Restarted()
+        last_remaining = remaining
+        time.sleep(sleep)
+
+    src = sqlite3.connect(source)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            try:
+                src.backup(dst, pages=pages, progress=progress)
+            except _Restarted:
+                src.backup(dst, pages=-1)
+            stats['paginas'] = dst.execute("PRAGMA page_count").fetchone()[0]
+            # Backups of a WAL database are WAL too; store them as a single file
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return stats
+
+
+def check_database(path: Path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise RuntimeError(f"Backup corrompido ({path}): {result}")
+
+
+def create_backup(database: Path, backups_dir: Path, keep: int = 14,
+                  pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP_SECONDS) -> dict:
+    """Takes a compressed, verified backup and rotates old ones.
+
+    Blocking; call it through ``asyncio.to_thread`` from the app.
+    """
+    started = time.monotonic()
+    backups_dir.mkdir(parents=True, exist_ok=True)
+    agora = datetime.now(timezone.utc)
+    target = backups_dir / backup_name(agora)
+    tmp_db = backups_dir / f".tmp-{uuid.uuid4().hex}.db"
+    tmp_gz = backups_dir / f".tmp-{uuid.uuid4().hex}{SUFFIX}"
+    try:
+        stats = copy_database(database, tmp_db, pages, sleep)
+        check_database(tmp_db)
+        with open(tmp_db, 'rb') as f_in, gzip.open(tmp_gz, 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(tmp_gz, target)
+        stats['tamanho_original'] = tmp_db.stat().st_size
+    finally:
+        tmp_db.unlink(missing_ok=True)
+        tmp_gz.unlink(missing_ok=True)
+
+    removidos = rotate_backups(backups_dir, keep)
+    stats.update({
+        'arquivo': target.name,
+        'tamanho': target.stat().st_size,
+        'duracao': round(time.monotonic() - started, 3),
+        'removidos': [p.name for p in removidos],
+    })
+    return stats
+
+
+def rotate_backups(backups_dir: Path, keep: int) -> List[Path]:
+    backups = list_backups(backups_dir)
+    removidos = backups[:-keep] if keep > 0 else []
+    for path in removidos:
+        path.unlink(missing_ok=True)
+    return removidos
+
+
+def find_backup(backups_dir: Path, ate: datetime) -> Optional[Path]:
+    """Newest backup taken at or before ``ate``."""
+    candidates = [p for p in list_backups(backups_dir) if backup_time(p) <= ate]
+    return candidates[-1] if candidates else None
+
+
+def restore_backup(backup: Path, database: Path) -> Path:
+    """Replaces ``database`` with the content of ``backup``; the app must be stopped.
+
+    The current file is kept next to it with a ``.antes-restauracao`` suffix.
+    Returns that path.
+    """
+    tmp_db = database.with_name(f".tmp-restore-{uuid.uuid4().hex}.db")
+    try:
+        with gzip.open(backup, 'rb') as f_in, open(tmp_db, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        check_database(tmp_db)
+        anterior = database.with_name(database.name + '.antes-restauracao')
+        if database.exists():
+            # Fold any pending WAL frames into the old file before moving it aside
+            conn = sqlite3.connect(database)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+            os.replace(database, anterior)
+        for suffix in ('-wal', '-shm'):
+            Path(f"{database}{suffix}").unlink(missing_ok=True)
+        os.replace(tmp_db, database)
+    finally:
+        tmp_db.unlink(missing_ok=True)
+    return anterior
+
+
+def parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def main(argv=None):
+    root = Path(__file__).parent
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', type=Path, default=Path(os.environ.get('DATABASE_PATH', root / 'database.db')))
+    parser.add_argument('--dir', type=Path, default=Path(os.environ.get('BACKUP_DIR', root / 'backups')))
+    sub = parser.add_subparsers(dest='comando', required=True)
+    criar = sub.add_parser('criar', help='Take a backup now')
+    criar.add_argument('--manter', type=int, default=int(os.environ.get('BACKUP_KEEP', 14)))
+    sub.add_parser('listar', help='List backups')
+    restaurar = sub.add_parser('restaurar', help='Restore a backup (stop the app first)')
+    restaurar.add_argument('arquivo', nargs='?', type=Path)
+    restaurar.add_argument('--ate', type=parse_time, help='Restore the newest backup at or before this time')
+    args = parser.parse_args(argv)
+
+    if args.comando == 'criar':
+        print(create_backup(args.db, args.dir, args.manter))
+    elif args.comando == 'listar':
+        for path in list_backups(args.dir):
+            print(f"{backup_time(path).isoformat()}  {path.stat().st_size:>12}  {path}")
+    else:
+        if bool(args.arquivo) == bool(args.ate):
+            parser.error('informe o arquivo ou --ate')
+        arquivo = args.arquivo or find_backup(args.dir, args.ate)
+        if not arquivo:
+            sys.exit(f"Nenhum backup até {args.ate.isoformat()}")
+        anterior = restore_backup(arquivo, args.db)
+        print(f"Restaurado {arquivo} em {args.db} (anterior em {anterior})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""Reproducible load test for the API.
+
+Seeds a throwaway SQLite database with synthetic data, drives the FastAPI app
+in-process (no network, no running server) with concurrent async clients and
+WebSocket listeners, and prints per-endpoint latency percentiles and
+throughput as JSON.
+
+    cd backend
+    python benchmark.py --db /tmp/bench.db --vestidos 50000 --alugueis 500000 --clientes 200000
+    python benchmark.py --db /tmp/bench.db --skip-seed --output bench.json
+    python benchmark.py --db /tmp/bench.db --skip-seed --baseline bench.json --tolerance 0.25
+    python benchmark.py --db /tmp/bench.db --skip-seed --backup
+
+With --baseline the run exits with status 1 when any endpoint's p95 regressed
+by more than --tolerance, so it can gate CI. A run where any request failed
+is invalid (errors are often fast, e.g. 429s, and would pass for a speed-up):
+it is reported under "failures" and exits with status 1 as well.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+CATEGORIAS = ['festa', 'noiva', 'debutante', 'madrinha', 'formatura', 'casual']
+TAMANHOS = ['PP', 'P', 'M', 'G', 'GG', '36', '38', '40', '42', '44']
+CORES = ['azul', 'vermelho', 'preto', 'branco', 'rosa', 'verde', 'dourado', 'prata']
+NOMES = ['Ana', 'Beatriz', 'Carla', 'Daniela', 'Eduarda', 'Fernanda', 'Gabriela', 'Helena',
+         'Isabela', 'Juliana', 'Larissa', 'Mariana', 'Natalia', 'Paula', 'Rafaela', 'Sofia']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Almeida',
+              'Ferreira', 'Rodrigues', 'Gomes', 'Martins', 'Araujo', 'Barbosa', 'Ribeiro']
+FORMAS_PAGAMENTO = ['pix', 'dinheiro', 'cartao_credito', 'cartao_debito']
+
+CHUNK_SIZE = 10000
+# Server settings for the run, unless set in the environment. A single client
+# sends every request, far past the per-client rate limits of admission
+# control; load shedding (EXPENSIVE_*) stays as configured
+SERVER_ENV = {
+    'RATE_LIMIT_RPS': '1000000',
+    'RATE_LIMIT_BURST': '1000000',
+    'RATE_LIMIT_ROUTE_RPS': '1000000',
+    'RATE_LIMIT_ROUTE_BURST': '1000000',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='bench.db', help='SQLite file to seed and benchmark (never the real database)')
+    parser.add_argument('--vestidos', type=int, default=5000)
+    parser.add_argument('--alugueis', type=int, default=50000)
+    parser.add_argument('--clientes', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42, help='Random seed, keeps runs reproducible')
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse an already seeded --db')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients per endpoint')
+    parser.add_argument('--ws-listeners', type=int, default=20, help='WebSocket listeners during the write phase')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='Previous JSON report to compare against')
+    parser.add_argument('--backup', action='store_true',
+                        help='Also measure reads and writes while an online backup runs')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 regression vs --baseline (0.25 = 25%%)')
+    return parser.parse_args(argv)
+
+
+# Synthetic data
+
+def gerar_cpf(rng: random.Random, cpf_check_digits) -> str:
+    while True:
+        base = ''.join(str(rng.randint(0, 9)) for _ in range(9))
+        if base != base[0] * 9:
+            return base + cpf_check_digits(base)
+
+
+def seed_database(db_path: Path, args, server) -> dict:
+    """Bulk-inserts synthetic rows straight through sqlite3, bypassing the API."""
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    agora = datetime.now(timezone.utc)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA synchronous = OFF')
+
+    vestido_ids = []
+    rows = []
+    fotos = []
+    for i in range(args.vestidos):
+        vestido_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        vestido_ids.append(vestido_id)
+        created = agora - timedelta(days=rng.randint(30, 1500))
+        rows.append((
+            vestido_id, f"Vestido {rng.choice(CORES)} {i}", f"BENCH-{i:07d}",
+            rng.choice(CATEGORIAS), rng.choice(TAMANHOS), rng.choice(CORES),
+            'Vestido gerado para benchmark', float(rng.randint(80, 900)),
+            'disponivel', '[]', created.isoformat()
+        ))
+        # Most dresses have a small gallery, some have none
+        for posicao in range(rng.choice([0, 1, 2, 3, 4])):
+            fotos.append((
+                str(uuid.UUID(int=rng.getrandbits(128))), vestido_id, f"/uploads/{rng.getrandbits(256):064x}.jpg",
+                posicao, rng.randint(50000, 900000), 1200, 1600, created.isoformat()
+            ))
+        if len(rows) >= CHUNK_SIZE:
+            _insert_vestidos(conn, rows, fotos)
+            rows, fotos = [], []
+    _insert_vestidos(conn, rows, fotos)
+
+    cliente_ids = []
+    cpfs = set()
+    rows = []
+    while len(cliente_ids) < args.clientes:
+        cpf = gerar_cpf(rng, server.cpf_check_digits)
+        if cpf in cpfs:
+            continue
+        cpfs.add(cpf)
+        cliente_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        cliente_ids.append((cliente_id, cpf))
+        nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+        rows.append((
+            cliente_id, nome, server.format_cpf(cpf), f"(11) 9{rng.randint(10000000, 99999999)}",
+            f"Rua {rng.choice(SOBRENOMES)}, {rng.randint(1, 2000)}", cpf, server.search_key(nome)
+        ))
+        if len(rows) >= CHUNK_SIZE:
+            _insert_clientes(conn, rows)
+            rows = []
+    _insert_clientes(conn, rows)
+
+    # At most one active rental per dress, the rest spread over the last years
+    ativos = set(rng.sample(range(args.alugueis), min(args.alugueis // 20, len(vestido_ids))))
+    livres = list(vestido_ids)
+    rng.shuffle(livres)
+    alugados = []
+    rows = []
+    for i in range(args.alugueis):
+        if i in ativos:
+            vestido_id = livres.pop()
+            alugados.append((vestido_id,))
+            retirada = agora - timedelta(days=rng.randint(0, 10))
+            status = 'ativo'
+        else:
+            vestido_id = rng.choice(vestido_ids)
+            retirada = agora - timedelta(days=rng.randint(11, 1460))
+            status = 'finalizado'
+        devolucao = retirada + timedelta(days=rng.randint(1, 7))
+        valor = float(rng.randint(80, 900))
+        sinal = round(valor * rng.choice([0.3, 0.5, 1.0]), 2)
+        created = retirada - timedelta(days=rng.randint(0, 30))
+        rows.append((
+            str(uuid.UUID(int=rng.getrandbits(128))), vestido_id, f"Vestido {i}", rng.choice(cliente_ids)[0],
+            retirada.isoformat(), devolucao.isoformat(), valor, sinal,
+            valor if status == 'finalizado' else sinal, rng.choice(FORMAS_PAGAMENTO),
+            status, '', created.isoformat(),
+            int(retirada.timestamp()), int(devolucao.timestamp()), int(created.timestamp())
+        ))
+        if len(rows) >= CHUNK_SIZE:
+            _insert_alugueis(conn, rows)
+            rows = []
+    _insert_alugueis(conn, rows)
+    conn.executemany("UPDATE vestidos SET status = 'alugado' WHERE id = ?", alugados)
+    conn.commit()
+    conn.close()
+
+    return {'seconds': round(time.perf_counter() - started, 3)}
+
+
+def _insert_vestidos(conn, rows, fotos):
+    conn.executemany(
+        '''INSERT INTO vestidos (id, nome, codigo, categoria, tamanho, cor, descricao, valor_aluguel, status, fotos, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    conn.executemany(
+        '''INSERT INTO vestido_fotos (id, vestido_id, url, posicao, tamanho, largura, altura, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', fotos)
+
+
+def _insert_clientes(conn, rows):
+    conn.executemany(
+        '''INSERT INTO clientes (id, nome_completo, cpf, telefone, endereco, cpf_digitos, nome_busca)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+
+
+def _insert_alugueis(conn, rows):
+    conn.executemany(
+        '''INSERT INTO alugueis (id, vestido_id, vestido_nome, cliente_id, data_retirada, data_devolucao,
+                                 valor_aluguel, valor_sinal, valor_pago, forma_pagamento, status, observacoes, created_at,
+                                 data_retirada_ts, data_devolucao_ts, created_at_ts)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+
+def sample_ids(db_path: Path, n: int = 50) -> dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        vestidos = [r[0] for r in conn.execute("SELECT id FROM vestidos ORDER BY id LIMIT ?", (n,))]
+        alugueis = [r[0] for r in conn.execute("SELECT id FROM alugueis ORDER BY id LIMIT ?", (n,))]
+        cpfs = [r[0] for r in conn.execute("SELECT cpf FROM clientes ORDER BY id LIMIT ?", (n,))]
+    finally:
+        conn.close()
+    if not vestidos or not alugueis or not cpfs:
+        sys.exit('Database has no data to benchmark, run without --skip-seed first')
+    return {'vestidos': vestidos, 'alugueis': alugueis, 'cpfs': cpfs}
+
+
+# In-process clients
+
+class WebSocketListener:
+    """Minimal ASGI WebSocket client that subscribes to ``topics`` and counts the changes pushed by the app."""
+
+    def __init__(self, app, token: str, topics=('vestidos',), path='/ws'):
+        self.app = app
+        self.path = path
+        self.query_string = f"token={token}".encode()
+        self.topics = list(topics)
+        self.received = 0
+        self.accepted = asyncio.Event()
+        self._inbox = asyncio.Queue()
+        self._task = None
+
+    async def start(self):
+        scope = {
+            'type': 'websocket', 'asgi': {'version': '3.0'}, 'scheme': 'ws', 'http_version': '1.1',
+            'path': self.path, 'raw_path': self.path.encode(), 'root_path': '',
+            'query_string': self.query_string, 'headers': [], 'subprotocols': [],
+            'client': ('bench', 0), 'server': ('bench', 80),
+        }
+        await self._inbox.put({'type': 'websocket.connect'})
+        self._task = asyncio.create_task(self.app(scope, self._inbox.get, self._send))
+        await asyncio.wait_for(self.accepted.wait(), timeout=10)
+        await self._inbox.put({'type': 'websocket.receive', 'text': json.dumps({'type': 'subscribe', 'topicos': self.topics})})
+
+    async def _send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif message['type'] == 'websocket.send' and json.loads(message['text'])['type'] == 'update':
+            self.received += 1
+
+    async def stop(self):
+        await self._inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        try:
+            await asyncio.wait_for(self._task, timeout=5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(client, name, make_request, total, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'rps': round(total / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def agenda_range(i):
+    """One of the last twelve months, so both cold and cached months get hit."""
+    inicio = (datetime.now(timezone.utc) - timedelta(days=30 * (i % 12))).date().replace(day=1)
+    return {'from': inicio.isoformat(), 'to': (inicio + timedelta(days=30)).isoformat()}
+
+
+async def rebuild_analytics(server):
+    async with server.get_db() as db:
+        await server.analytics.rebuild(db)
+
+
+def build_scenarios(ids):
+    """(name, request factory) pairs; factories map a request index to (method, url, kwargs)."""
+    pick = lambda key, i: ids[key][i % len(ids[key])]
+    return [
+        ('GET /api/auth/me', lambda i: ('GET', '/api/auth/me', {})),
+        ('GET /api/dashboard/stats', lambda i: ('GET', '/api/dashboard/stats', {})),
+        ('GET /api/agenda', lambda i: ('GET', '/api/agenda', {'params': agenda_range(i)})),
+        ('GET /api/vestidos?status', lambda i: ('GET', '/api/vestidos', {'params': {'status': 'alugado'}})),
+        ('GET /api/vestidos?search', lambda i: ('GET', '/api/vestidos', {'params': {'search': str(i % 100)}})),
+        ('GET /api/vestidos/{id}', lambda i: ('GET', f"/api/vestidos/{pick('vestidos', i)}", {})),
+        ('GET /api/alugueis?status', lambda i: ('GET', '/api/alugueis', {'params': {'status': 'ativo'}})),
+        ('GET /api/alugueis/{id}', lambda i: ('GET', f"/api/alugueis/{pick('alugueis', i)}", {})),
+        ('GET /api/analytics/vestidos', lambda i: ('GET', '/api/analytics/vestidos', {'params': {'ordem': ('receita', 'ocupacao', 'dias_ocioso')[i % 3]}})),
+        ('GET /api/analytics/categoria', lambda i: ('GET', '/api/analytics/categoria', {})),
+        ('GET /api/clientes/autocomplete', lambda i: ('GET', '/api/clientes/autocomplete', {'params': {'q': (pick('cpfs', i)[:5], NOMES[i % len(NOMES)][:3])[i % 2]}})),
+        ('GET /api/historico/vestido/{id}', lambda i: ('GET', f"/api/historico/vestido/{pick('vestidos', i)}", {})),
+        ('GET /api/historico/cliente/{cpf}', lambda i: ('GET', f"/api/historico/cliente/{pick('cpfs', i)}", {})),
+    ]
+
+
+async def run_backup_phase(client, server, ids, args):
+    """Runs a read and a write scenario while backup.create_backup copies the database."""
+    import tempfile
+
+    import backup
+
+    pick = lambda key, i: ids[key][i % len(ids[key])]
+    scenarios = [
+        ('GET /api/vestidos/{id} [backup]', lambda i: ('GET', f"/api/vestidos/{pick('vestidos', i)}", {})),
+        ('PUT /api/vestidos/{id} [backup]', lambda i: ('PUT', f"/api/vestidos/{pick('vestidos', i)}",
+                                                       {'json': {'cor': CORES[i % len(CORES)]}})),
+    ]
+    report = {}
+    with tempfile.TemporaryDirectory() as backups_dir:
+        task = asyncio.create_task(asyncio.to_thread(backup.create_backup, server.DATABASE_PATH, Path(backups_dir), 1))
+        for name, make_request in scenarios:
+            report[name] = await run_endpoint(client, name, make_request, args.requests, args.concurrency)
+            report[name]['backup_em_andamento'] = not task.done()
+        stats = await task
+    for name in report:
+        report[name]['backup'] = {k: stats[k] for k in ('duracao', 'passos', 'reinicios', 'paginas')}
+    return report
+
+
+async def run_benchmark(args, server, ids):
+    import httpx
+
+    report = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        response = await client.post('/api/auth/login', json={'email': 'admin@vestidos.com', 'password': 'admin123'})
+        response.raise_for_status()
+        token = response.json()['token']
+        client.headers['Authorization'] = f"Bearer {token}"
+
+        for name, make_request in build_scenarios(ids):
+            report[name] = await run_endpoint(client, name, make_request, args.requests, args.concurrency)
+
+        # Write phase: every update fans out to all listeners, subscribed to the dress list
+        listeners = [WebSocketListener(server.app, token) for _ in range(args.ws_listeners)]
+        for listener in listeners:
+            await listener.start()
+        saved_before = server.manager.metrics()['economizadas']
+        statuses = ['manutencao', 'disponivel']
+        write_name = 'PUT /api/vestidos/{id}'
+        report[write_name] = await run_endpoint(
+            client, write_name,
+            lambda i: ('PUT', f"/api/vestidos/{ids['vestidos'][i % len(ids['vestidos'])]}",
+                       {'json': {'status': statuses[i % 2]}}),
+            args.requests, args.concurrency
+        )
+        # Let in-flight pushes land before counting
+        await asyncio.sleep(0.5)
+        for listener in listeners:
+            await listener.stop()
+        report[write_name]['ws_listeners'] = len(listeners)
+        report[write_name]['ws_messages'] = sum(listener.received for listener in listeners)
+        report[write_name]['broadcasts_saved'] = server.manager.metrics()['economizadas'] - saved_before
+
+        if args.backup:
+            report.update(await run_backup_phase(client, server, ids, args))
+
+    return report
+
+
+def failures(report):
+    """Endpoints with failed requests; their latencies measure the errors, not the endpoint."""
+    return [{'endpoint': name, 'errors': current['errors'], 'requests': current['requests']}
+            for name, current in report['endpoints'].items() if current['errors']]
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous or not previous.get('p95_ms'):
+            continue
+        ratio = current['p95_ms'] / previous['p95_ms']
+        if ratio > 1 + tolerance:
+            regressions.append({'endpoint': name, 'baseline_p95_ms': previous['p95_ms'],
+                                'p95_ms': current['p95_ms'], 'ratio': round(ratio, 3)})
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = Path(args.db).resolve()
+    # server reads DATABASE_PATH at import time, so it must be set first
+    os.environ['DATABASE_PATH'] = str(db_path)
+    for name, value in SERVER_ENV.items():
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import server
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'python': sys.version.split()[0],
+    }
+    if not args.skip_seed:
+        if db_path.exists():
+            db_path.unlink()
+        asyncio.run(server.init_db())
+        report['seed'] = seed_database(db_path, args, server)
+        # Seeding bypasses the API, so the analytics aggregates are built afterwards
+        asyncio.run(rebuild_analytics(server))
+    else:
+        asyncio.run(server.init_db())
+
+    ids = sample_ids(db_path)
+    report['endpoints'] = asyncio.run(run_benchmark(args, server, ids))
+
+    status = 0
+    report['failures'] = failures(report)
+    report['valid'] = not report['failures']
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report['regressions'] else 0
+    if report['failures']:
+        status = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
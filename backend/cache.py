@@ -0,0 +1,102 @@
+"""In-process cache of read endpoint responses.
+
+``ResponseCache.get_or_compute(key, tags, compute)`` returns the cached value
+for ``key`` or runs ``compute`` once, however many requests ask for the same
+key meanwhile (single flight): the others await the same task, which keeps
+running if the request that started it goes away.
+
+Each entry is tagged with the tables it was read from. Write handlers call
+``invalidate(tag)`` after committing, which drops every entry with that tag.
+A value computed while one of its tags was invalidated is returned to its
+callers but not stored, since it may predate the write, and requests
+arriving after the invalidation start a new computation instead of joining
+it. Entries expire
+after ``ttl`` seconds, which bounds staleness when several workers each hold
+their own cache, and the least recently used are evicted past ``max_entries``.
+"""
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Iterable
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (stored at, tags, value)
+        self._entries: OrderedDict = OrderedDict()
+        self._by_tag: Dict[Hashable, set] = {}
+        # key -> (task, tag generations when it started)
+        self._inflight: Dict[Hashable, tuple] = {}
+        self._generations: Counter = Counter()
+        self.hits = self.misses = self.coalesced = self.evictions = self.invalidations = 0
+
+    async def get_or_compute(self, key: Hashable, tags: Iterable[Hashable], compute: Callable[[], Awaitable]):
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] <= self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+        tags = tuple(tags)
+        generations = [self._generations[tag] for tag in tags]
+        inflight = self._inflight.get(key)
+        # A computation started before a write may return the old data
+        if inflight is None or inflight[1] != generations:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = (task, generations)
+            task.add_done_callback(lambda done: self._finish(key, tags, generations, done))
+        else:
+            task = inflight[0]
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, tags: tuple, generations: list, task: asyncio.Task):
+        # A newer computation may have replaced this one
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+        # Reading the exception also keeps asyncio from logging it when no caller is left
+        if task.cancelled() or task.exception() is not None:
+            return
+        if [self._generations[tag] for tag in tags] != generations:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic(), tags, task.result())
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            for tag in entry[1]:
+                keys = self._by_tag.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_tag[tag]
+
+    def invalidate(self, *tags: Hashable):
+        for tag in tags:
+            self._generations[tag] += 1
+            for key in list(self._by_tag.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def metrics(self) -> dict:
+        pedidos = self.hits + self.misses + self.coalesced
+        return {
+            'entradas': len(self._entries),
+            'capacidade': self.max_entries,
+            'ttl_s': self.ttl,
+            'acertos': self.hits,
+            'falhas': self.misses,
+            'compartilhadas': self.coalesced,
+            'em_andamento': len(self._inflight),
+            'despejos': self.evictions,
+            'invalidacoes': self.invalidations,
+            'taxa_acerto': round((self.hits + self.coalesced) / pedidos, 3) if pedidos else None,
+        }
@@ -0,0 +1,283 @@
+"""Rental contracts (with the payment receipt) as PDF.
+
+Layout is CPU work, so ``render_contrato`` and ``render_paginas`` run in a
+process pool: they take plain dicts and return bytes. The PDF itself is
+written by ``PdfStream`` with the standard Helvetica fonts, which every
+viewer has, so no font files or PDF library are needed. It emits objects
+in order and the page tree and cross-reference table last, which lets a
+multi-contract document go out page by page while later pages are still
+being laid out.
+
+Single contracts are cached on disk as ``<aluguel_id>-<hash>.pdf``, the hash
+covering everything printed on them; ``discard`` removes a rental's files
+when it changes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import unicodedata
+from pathlib import Path
+from typing import List, Optional
+
+# Bump when the layout changes, so cached files are not reused
+LAYOUT_VERSION = 1
+# A4 in points
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 56
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+FIRST_PAGE_OBJECT = 3 + len(FONTS)
+
+CLAUSULAS = [
+    "O LOCATÁRIO declara receber o vestido descrito acima em perfeito estado de conservação e limpeza, "
+    "comprometendo-se a devolvê-lo nas mesmas condições até a data de devolução indicada.",
+    "O saldo da locação deve ser quitado até a retirada do vestido.",
+    "Atrasos na devolução, danos, manchas ou ajustes não autorizados serão cobrados conforme a política "
+    "da loja.",
+    "A lavagem e a conservação da peça após a devolução são de responsabilidade da LOCADORA.",
+]
+
+# Helvetica advance widths (1/1000 em) of the characters that differ from 556
+_WIDTHS = {}
+for _chars, _width in (
+    (" !,./:;I[\\]fijlt'", 278), ("\"()-`r{}", 333), ("*", 389), ("^", 469), ("+<=>~", 584),
+    ("Jcksvxyz", 500), ("FTZ", 611), ("ABEKPSVXY", 667), ("CDHNRUw", 722), ("GOQ", 778),
+    ("M", 833), ("%m", 889), ("W", 944), ("@", 1015), ("|", 260),
+):
+    for _char in _chars:
+        _WIDTHS[_char] = _width
+
+
+def text_width(text: str, size: float) -> float:
+    # Accented letters are as wide as their base letter
+    return sum(_WIDTHS.get(unicodedata.normalize('NFD', c)[0], 556) for c in text) * size / 1000
+
+
+def wrap(text: str, size: float, width: float) -> List[str]:
+    lines = []
+    for paragraph in (text or '').splitlines() or ['']:
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _escape(text: str) -> bytes:
+    data = text.encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class Pages:
+    """Lays out lines top to bottom, starting a new page when one fills up."""
+
+    def __init__(self):
+        self.pages: List[bytes] = []
+        self._ops: List[bytes] = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _room(self, height: float):
+        if self.y - height < MARGIN:
+            self.break_page()
+
+    def break_page(self):
+        self.pages.append(b'\n'.join(self._ops))
+        self._ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def text(self, text: str, size: float = 10, bold: bool = False, x: float = MARGIN, center: bool = False,
+             leading: Optional[float] = None):
+        leading = leading or size * 1.4
+        self._room(leading)
+        self.y -= leading
+        if center:
+            x = (PAGE_WIDTH - text_width(text, size)) / 2
+        font = 'F2' if bold else 'F1'
+        self._ops.append(b'BT /%s %.1f Tf %.2f %.2f Td (%s) Tj ET' % (font.encode(), size, x, self.y, _escape(text)))
+
+    def paragraph(self, text: str, size: float = 10, indent: float = 0):
+        for line in wrap(text, size, PAGE_WIDTH - 2 * MARGIN - indent):
+            self.text(line, size, x=MARGIN + indent)
+
+    def field(self, label: str, value: str, size: float = 10):
+        # Bold glyphs run about 10% wider than the regular widths above
+        indent = text_width(f"{label}: ", size) * 1.1 + 2
+        self.text(f"{label}:", size, bold=True)
+        # The first value line goes next to the label
+        self.y += size * 1.4
+        for line in wrap(value, size, PAGE_WIDTH - 2 * MARGIN - indent):
+            self.text(line, size, x=MARGIN + indent)
+
+    def space(self, height: float):
+        self.y -= height
+
+    def signatures(self, *names: str):
+        self._room(60)
+        self.y -= 44
+        column = (PAGE_WIDTH - 2 * MARGIN) / len(names)
+        for i, name in enumerate(names):
+            left = MARGIN + i * column + 12
+            right = MARGIN + (i + 1) * column - 12
+            self._ops.append(b'%.2f %.2f m %.2f %.2f l S' % (left, self.y, right, self.y))
+            self._ops.append(b'BT /F1 9.0 Tf %.2f %.2f Td (%s) Tj ET' % (
+                (left + right - text_width(name, 9)) / 2, self.y - 12, _escape(name)))
+        self.y -= 16
+
+    def finish(self) -> List[bytes]:
+        if self._ops:
+            self.break_page()
+        return self.pages
+
+
+class PdfStream:
+    """Writes a PDF in pieces: ``start()``, one ``page()`` per page, then ``finish()``."""
+
+    def __init__(self):
+        self._offsets = {}
+        self._size = 0
+        self._next = FIRST_PAGE_OBJECT
+        self._kids: List[int] = []
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        data = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self._offsets[number] = self._size
+        self._size += len(data)
+        return data
+
+    def start(self) -> bytes:
+        head = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self._size = len(head)
+        parts = [head, self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')]
+        for number, font in enumerate(FONTS.values(), 3):
+            parts.append(self._object(
+                number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % font.encode()
+            ))
+        return b''.join(parts)
+
+    def page(self, content: bytes) -> bytes:
+        contents, page = self._next, self._next + 1
+        self._next += 2
+        self._kids.append(page)
+        fonts = b' '.join(b'/%s %d 0 R' % (name.encode(), number) for number, name in enumerate(FONTS, 3))
+        return self._object(
+            contents, b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)
+        ) + self._object(page, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R >>'
+            % (PAGE_WIDTH, PAGE_HEIGHT, fonts, contents)
+        ))
+
+    def finish(self) -> bytes:
+        pages = self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % kid for kid in self._kids), len(self._kids)))
+        count = self._next
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % count]
+        xref += [b'%010d 00000 n \n' % self._offsets[number] for number in range(1, count)]
+        trailer = b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, self._size)
+        return pages + b''.join(xref) + trailer
+
+
+def _data(value: Optional[str]) -> str:
+    # ISO date or datetime -> dd/mm/aaaa
+    if not value:
+        return '-'
+    ano, mes, dia = value[:10].split('-')
+    return f"{dia}/{mes}/{ano}"
+
+
+def _reais(value: Optional[float]) -> str:
+    texto = f"{value or 0:,.2f}"
+    return 'R$ ' + texto.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def render_paginas(dados: dict) -> List[bytes]:
+    """Content streams of one rental's contract and receipt; ``dados`` as built by the server."""
+    p = Pages()
+    p.text("CONTRATO DE LOCAÇÃO DE VESTIDO", 15, bold=True, center=True, leading=22)
+    p.text(f"Loja {dados['loja']} - Contrato nº {dados['id'][:8].upper()}", 9, center=True)
+    p.space(10)
+
+    p.text("LOCATÁRIO", 11, bold=True, leading=18)
+    p.field("Nome", dados['nome_completo'])
+    p.field("CPF", dados['cpf'])
+    p.field("Telefone", dados['telefone'] or '-')
+    p.field("Endereço", dados['endereco'] or '-')
+    p.space(6)
+
+    p.text("VESTIDO E PERÍODO", 11, bold=True, leading=18)
+    vestido = dados['vestido_nome']
+    if dados.get('vestido_codigo'):
+        vestido += f" (código {dados['vestido_codigo']})"
+    p.field("Vestido", vestido)
+    p.field("Retirada", _data(dados['data_retirada']))
+    p.field("Devolução", _data(dados['data_devolucao']))
+    p.space(6)
+
+    p.text("VALORES", 11, bold=True, leading=18)
+    p.field("Valor da locação", _reais(dados['valor_aluguel']))
+    p.field("Sinal", _reais(dados['valor_sinal']))
+    p.field("Total pago", _reais(dados['valor_pago']))
+    p.field("Saldo", _reais(max((dados['valor_aluguel'] or 0) - (dados['valor_pago'] or 0), 0)))
+    p.field("Forma de pagamento", dados['forma_pagamento'] or '-')
+    if dados.get('observacoes'):
+        p.space(6)
+        p.text("OBSERVAÇÕES", 11, bold=True, leading=18)
+        p.paragraph(dados['observacoes'])
+    p.space(6)
+
+    p.text("CLÁUSULAS", 11, bold=True, leading=18)
+    for numero, clausula in enumerate(CLAUSULAS, 1):
+        p.paragraph(f"{numero}. {clausula}", 9)
+    p.signatures("LOCADORA", "LOCATÁRIO")
+
+    p.space(16)
+    p.text("RECIBO", 11, bold=True, leading=18)
+    p.paragraph(
+        f"Recebemos de {dados['nome_completo']}, CPF {dados['cpf']}, a quantia de {_reais(dados['valor_pago'])} "
+        f"referente à locação do vestido {dados['vestido_nome']}, com retirada em {_data(dados['data_retirada'])} "
+        f"e devolução em {_data(dados['data_devolucao'])}."
+    )
+    p.signatures("LOCADORA")
+    return p.finish()
+
+
+def render_contrato(dados: dict) -> bytes:
+    pdf = PdfStream()
+    return pdf.start() + b''.join(pdf.page(page) for page in render_paginas(dados)) + pdf.finish()
+
+
+def content_hash(dados: dict) -> str:
+    canonical = json.dumps([LAYOUT_VERSION, dados], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def cache_path(directory: Path, dados: dict) -> Path:
+    return Path(directory) / f"{dados['id']}-{content_hash(dados)}.pdf"
+
+
+def store(path: Path, pdf: bytes):
+    """Writes ``pdf`` atomically and removes the rental's files for older contents."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+    discard(path.parent, path.name.rsplit('-', 1)[0], keep=path)
+
+
+def load(path: Path) -> Optional[bytes]:
+    """The cached PDF, or None if it is missing (never written, or discarded by a newer version or an edit)."""
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def discard(directory: Path, aluguel_id: str, keep: Optional[Path] = None):
+    for path in Path(directory).glob(f"{aluguel_id}-*.pdf"):
+        if path != keep:
+            path.unlink(missing_ok=True)
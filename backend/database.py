@@ -0,0 +1,295 @@
+"""Database access for SQLite (default) and PostgreSQL.
+
+Handlers use the small aiosqlite interface: ``execute`` returning a cursor
+with ``fetchone``/``fetchall``/``rowcount``, ``executemany``, ``commit`` and
+``rollback``, with rows readable by name and by position. ``open_database``
+returns a backend whose ``connect()`` gives such a connection:
+
+- ``SqliteDatabase``: a plain ``aiosqlite`` connection to the database file.
+- ``PostgresDatabase`` (DATABASE_URL=postgresql://...): a connection leased
+  from an ``asyncpg`` pool. The app's SQL, written for SQLite with ``?`` or
+  ``:name`` placeholders, is translated once per statement text and then
+  runs as a prepared statement cached on each pooled connection.
+
+The PostgreSQL adapter keeps the sqlite3 module's transaction behaviour: a
+write outside a transaction opens one implicitly, ``commit()`` ends it and
+closing the connection rolls back anything left open. ``BEGIN IMMEDIATE``
+also takes a database-wide advisory lock, so the multi-statement writes
+that relied on SQLite's single writer still serialize; single-statement
+writes and all reads run concurrently.
+"""
+import asyncio
+import re
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import aiosqlite
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+# Prepared statements kept per pooled connection; the app issues a few hundred distinct ones
+STATEMENT_CACHE_SIZE = 512
+# pg_advisory_xact_lock key standing in for SQLite's write lock
+WRITE_LOCK_KEY = 0x76657374
+
+# What a failing statement raises on either backend: any error, and constraint violations
+try:
+    import asyncpg
+except ImportError:
+    QUERY_ERRORS = (sqlite3.Error,)
+    INTEGRITY_ERRORS = (sqlite3.IntegrityError,)
+else:
+    QUERY_ERRORS = (sqlite3.Error, asyncpg.PostgresError)
+    INTEGRITY_ERRORS = (sqlite3.IntegrityError, asyncpg.IntegrityConstraintViolationError)
+
+
+def open_database(target, pool_min_size: int = POOL_MIN_SIZE, pool_max_size: int = POOL_MAX_SIZE):
+    """A PostgresDatabase for postgres:// URLs, a SqliteDatabase for file paths."""
+    if str(target).startswith(('postgres://', 'postgresql://')):
+        return PostgresDatabase(str(target), pool_min_size, pool_max_size)
+    return SqliteDatabase(Path(target))
+
+
+class SqliteDatabase:
+    dialect = 'sqlite'
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __repr__(self):
+        return f"SqliteDatabase({self.path})"
+
+    def connect(self):
+        return aiosqlite.connect(self.path)
+
+    async def close(self):
+        pass
+
+
+class PostgresDatabase:
+    dialect = 'postgres'
+
+    def __init__(self, url: str, pool_min_size: int = POOL_MIN_SIZE, pool_max_size: int = POOL_MAX_SIZE):
+        self.url = url
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"PostgresDatabase({re.sub(r'://[^@/]*@', '://***@', self.url)})"
+
+    def connect(self) -> 'PostgresConnection':
+        return PostgresConnection(self)
+
+    async def pool(self):
+        # Created on first use, inside the running event loop
+        if self._pool is None:
+            async with self._lock:
+                if self._pool is None:
+                    import asyncpg
+
+                    self._pool = await asyncpg.create_pool(
+                        self.url, min_size=self.pool_min_size, max_size=self.pool_max_size,
+                        statement_cache_size=STATEMENT_CACHE_SIZE, init=_init_connection,
+                    )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def _decode_numeric(text: str):
+    # SUM() of integers is NUMERIC in PostgreSQL; return it as SQLite would
+    return float(text) if '.' in text or 'e' in text.lower() else int(text)
+
+
+async def _init_connection(conn):
+    await conn.set_type_codec('numeric', encoder=str, decoder=_decode_numeric, schema='pg_catalog', format='text')
+
+
+class Cursor:
+    def __init__(self, rows: Sequence = (), rowcount: int = -1):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+        self.lastrowid = None
+
+    async def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+class PostgresConnection:
+    """One pooled asyncpg connection behind the aiosqlite interface; use with ``async with``."""
+
+    def __init__(self, database: PostgresDatabase):
+        self.database = database
+        self.conn = None
+        # Rows always support both access styles; kept so handlers can set it
+        self.row_factory = None
+
+    async def __aenter__(self):
+        self.conn = await (await self.database.pool()).acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            if self.conn.is_in_transaction():
+                await self.conn.execute("ROLLBACK")
+        finally:
+            await (await self.database.pool()).release(self.conn)
+            self.conn = None
+
+    async def _begin_if_needed(self, statement: 'Statement'):
+        if statement.kind == 'write' and not self.conn.is_in_transaction():
+            await self.conn.execute("BEGIN")
+
+    async def execute(self, sql: str, params=()) -> Cursor:
+        statement = translate(sql)
+        if statement.kind == 'noop':
+            return Cursor()
+        if statement.kind == 'begin':
+            await self.conn.execute("BEGIN")
+            if statement.exclusive:
+                await self.conn.execute(f"SELECT pg_advisory_xact_lock({WRITE_LOCK_KEY})")
+            return Cursor()
+        args = statement.bind(params)
+        if statement.kind == 'read':
+            return Cursor(await self.conn.fetch(statement.sql, *args))
+        await self._begin_if_needed(statement)
+        status = await self.conn.execute(statement.sql, *args)
+        count = status.rsplit(' ', 1)[-1]
+        return Cursor(rowcount=int(count) if count.isdigit() else -1)
+
+    async def executemany(self, sql: str, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if not seq_of_params:
+            return Cursor()
+        statement = translate(sql)
+        await self._begin_if_needed(statement)
+        await self.conn.executemany(statement.sql, [statement.bind(p) for p in seq_of_params])
+        return Cursor()
+
+    async def commit(self):
+        if self.conn.is_in_transaction():
+            await self.conn.execute("COMMIT")
+
+    async def rollback(self):
+        if self.conn.is_in_transaction():
+            await self.conn.execute("ROLLBACK")
+
+
+class Statement(NamedTuple):
+    sql: str
+    # read (returns rows), write (implicitly transactional), other (DDL, savepoints...), begin, noop
+    kind: str
+    # Parameter names for :name style, None for positional ?
+    names: Optional[Tuple[str, ...]] = None
+    exclusive: bool = False
+
+    def bind(self, params) -> List:
+        if self.names is not None:
+            return [params[name] for name in self.names]
+        return list(params)
+
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\?|(?<!:):([A-Za-z_]\w*)")
+_FOREIGN_KEY = re.compile(r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)", re.I)
+_STRFTIME_EPOCH = re.compile(r"CAST\(strftime\('%s',\s*([\w.]+)\)\s+AS\s+INTEGER\)", re.I)
+_MIN_MAX = re.compile(r"\b(MIN|MAX)\s*\(", re.I)
+_PRAGMA_TABLE_INFO = re.compile(r"PRAGMA\s+table_info\((\w+)\)", re.I)
+
+
+def _scalar_min_max(sql: str) -> str:
+    """MIN(a, b)/MAX(a, b) are scalar functions in SQLite: LEAST/GREATEST in PostgreSQL."""
+    for match in reversed(list(_MIN_MAX.finditer(sql))):
+        depth, commas = 0, 0
+        for char in sql[match.end() - 1:]:
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+            elif char == ',' and depth == 1:
+                commas += 1
+        if commas:
+            name = 'LEAST' if match.group(1).upper() == 'MIN' else 'GREATEST'
+            sql = sql[:match.start()] + name + sql[match.start(1) + 3:]
+    return sql
+
+
+def _placeholders(sql: str) -> Tuple[str, Optional[Tuple[str, ...]]]:
+    names: List[str] = []
+    positional = 0
+    parts, last = [], 0
+
+    def replace(fragment: str) -> str:
+        def sub(match):
+            nonlocal positional
+            if match.group(1):
+                if match.group(1) not in names:
+                    names.append(match.group(1))
+                return f"${names.index(match.group(1)) + 1}"
+            positional += 1
+            return f"${positional}"
+        return _PLACEHOLDER.sub(sub, fragment)
+
+    # String literals are copied untouched
+    for literal in _LITERAL.finditer(sql):
+        parts += [replace(sql[last:literal.start()]), literal.group(0)]
+        last = literal.end()
+    parts.append(replace(sql[last:]))
+    return ''.join(parts), tuple(names) if names else None
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> Statement:
+    """Rewrites one SQLite statement as used by the app into PostgreSQL."""
+    text = sql.strip().rstrip(';')
+    head = text.split(None, 2)
+    first = head[0].upper() if head else ''
+
+    if first == 'PRAGMA':
+        table_info = _PRAGMA_TABLE_INFO.match(text)
+        if table_info:
+            # Same columns as SQLite's table_info: cid, name, type, notnull, dflt_value, pk
+            return Statement(f'''
+                SELECT ordinal_position - 1, column_name, data_type, is_nullable = 'NO', column_default, 0
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = '{table_info.group(1)}'
+                ORDER BY ordinal_position''', 'read')
+        if re.match(r"PRAGMA\s+optimize", text, re.I):
+            return Statement("ANALYZE", 'other')
+        return Statement('', 'noop')
+    if first == 'BEGIN':
+        return Statement('', 'begin', exclusive=len(head) > 1 and head[1].upper() in ('IMMEDIATE', 'EXCLUSIVE'))
+
+    if first in ('CREATE', 'ALTER') and len(head) > 1 and head[1].upper() == 'TABLE':
+        text = _FOREIGN_KEY.sub('', text)
+        text = re.sub(r'\bREAL\b', 'DOUBLE PRECISION', text, flags=re.I)
+        text = re.sub(r'\bINTEGER\b', 'BIGINT', text, flags=re.I)
+
+    if re.match(r"INSERT\s+OR\s+IGNORE\b", text, re.I):
+        text = re.sub(r"INSERT\s+OR\s+IGNORE\b", "INSERT", text, count=1, flags=re.I) + " ON CONFLICT DO NOTHING"
+    text = _STRFTIME_EPOCH.sub(r"CAST(EXTRACT(EPOCH FROM CAST(\1 AS TIMESTAMPTZ)) AS BIGINT)", text)
+    text = _scalar_min_max(text)
+    # SQLite's LIKE ignores ASCII case
+    text = re.sub(r'\bLIKE\b', 'ILIKE', text, flags=re.I)
+    text, names = _placeholders(text)
+
+    if first in ('SELECT', 'WITH', 'VALUES') or re.search(r'\bRETURNING\b', text, re.I):
+        kind = 'read'
+    elif first in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+        kind = 'write'
+    else:
+        kind = 'other'
+    return Statement(text, kind, names)
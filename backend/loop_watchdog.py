@@ -0,0 +1,167 @@
+"""Event loop lag monitor and blocking call detector.
+
+Anything synchronous that runs on the event loop (hashing a password,
+decoding a large JSON document, file I/O) stalls every request and
+WebSocket at once. ``LoopWatchdog`` runs a thread that, every ``interval``
+seconds, schedules a callback on the loop and waits for it: the delay
+before it runs is the loop lag, kept for metrics. If it has not run after
+``threshold`` seconds, the loop is stuck in some callback, so the thread
+takes the loop thread's stack right then, which points at the blocking
+call, and logs it; the callback, when it finally runs, gives how long the
+block lasted. Blocks longer than ``threshold + interval`` are always
+caught, shorter ones when a check falls inside them.
+
+Test mode: with a ``budget``, ``BlockBudgetMiddleware`` turns the response
+of a request during which the loop was blocked for longer than the budget
+into a 500 carrying the stack, so a smoke test run against the server
+fails on it. Requests run one at a time in that mode are blamed precisely;
+with concurrent requests a block is charged to all that were in flight.
+Right after startup the lazy imports warming up in a thread hold the GIL
+for a few milliseconds at a time, so budgets below ~10ms are flaky.
+"""
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import List
+
+STACK_DEPTH = 25
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, keep: int = 20, window: int = 1200):
+        self.threshold = threshold
+        self.interval = interval
+        self.blocks = deque(maxlen=keep)
+        self.total_blocks = 0
+        # Lag of the last ``window`` checks, in seconds
+        self._lags = deque(maxlen=window)
+        self._max_lag = 0.0
+        self._loop = None
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts watching the running loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _pong(self, done: threading.Event, sent: float):
+        lag = time.monotonic() - sent
+        self._lags.append(lag)
+        self._max_lag = max(self._max_lag, lag)
+        done.set()
+
+    def _watch(self):
+        done = threading.Event()
+        while not self._stop.is_set():
+            done.clear()
+            sent = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(self._pong, done, sent)
+            except RuntimeError:
+                # Loop closed
+                return
+            block = None
+            if not done.wait(self.threshold):
+                block = self._blocked(sent)
+            while not done.wait(self.interval):
+                if self._stop.is_set():
+                    return
+            if block is not None:
+                block['duracao_ms'] = round(self._lags[-1] * 1000, 1)
+                logging.warning("Event loop was blocked for %.0fms", block['duracao_ms'])
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - sent)))
+
+    def _blocked(self, sent: float) -> dict:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = [f"{f.filename}:{f.lineno} in {f.name}" for f in traceback.extract_stack(frame)[-STACK_DEPTH:]] \
+            if frame is not None else []
+        so_far = time.monotonic() - sent
+        block = {
+            'inicio': round(time.time() - so_far, 3),
+            # Until the loop comes back, how long it had been blocked when the stack was taken
+            'duracao_ms': round(so_far * 1000, 1),
+            'pilha': stack,
+            '_monotonic': sent,
+        }
+        self.blocks.append(block)
+        self.total_blocks += 1
+        logging.warning("Event loop blocked for over %.0fms in:\n  %s", so_far * 1000, '\n  '.join(stack))
+        return block
+
+    def blocks_since(self, started: float) -> List[dict]:
+        """Blocks that ended, or were still going, after ``started`` (time.monotonic())."""
+        return [b for b in list(self.blocks) if b['_monotonic'] + b['duracao_ms'] / 1000 >= started]
+
+    def metrics(self) -> dict:
+        lags = sorted(self._lags)
+
+        def percentile(p):
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 1) if lags else None
+
+        return {
+            'atraso_ms': {
+                'atual': round(self._lags[-1] * 1000, 1) if self._lags else None,
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': round(self._max_lag * 1000, 1),
+            },
+            'limite_bloqueio_ms': self.threshold * 1000,
+            'bloqueios': self.total_blocks,
+            'ultimos_bloqueios': [{k: v for k, v in b.items() if not k.startswith('_')} for b in self.blocks],
+        }
+
+
+class BlockBudgetMiddleware:
+    """Test mode: fails requests during which the loop blocked for longer than ``budget`` seconds."""
+
+    def __init__(self, app, watchdog: LoopWatchdog, budget: float):
+        self.app = app
+        self.watchdog = watchdog
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.monotonic()
+        failed = False
+
+        async def checked_send(message):
+            nonlocal failed
+            if failed:
+                return
+            if message['type'] == 'http.response.start':
+                blocks = [b for b in self.watchdog.blocks_since(started) if b['duracao_ms'] > self.budget * 1000]
+                if blocks:
+                    failed = True
+                    worst = max(blocks, key=lambda b: b['duracao_ms'])
+                    logging.error("%s %s blocked the event loop for %.0fms (budget %.0fms)",
+                                  scope['method'], scope['path'], worst['duracao_ms'], self.budget * 1000)
+                    body = json.dumps({
+                        'detail': f"Bloqueou o event loop por {worst['duracao_ms']:.0f}ms "
+                                  f"(orçamento {self.budget * 1000:.0f}ms)",
+                        'pilha': worst['pilha'],
+                    }).encode()
+                    await send({'type': 'http.response.start', 'status': 500, 'headers': [
+                        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    ]})
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+            await send(message)
+
+        await self.app(scope, receive, checked_send)
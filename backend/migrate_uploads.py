@@ -0,0 +1,36 @@
+"""Copies uploaded photos from the local uploads directory to an S3-compatible bucket.
+
+The bucket is configured with the same S3_* variables the app reads with
+STORAGE_BACKEND=s3. Files already in the bucket with the same size are
+skipped, so the copy can be re-run until it reports nothing left, then the
+app restarted with STORAGE_BACKEND=s3. URLs stored in the database do not
+change: ``/uploads/<nome>`` redirects to the bucket.
+
+    cd backend
+    S3_BUCKET=vestidos python migrate_uploads.py --dry-run
+    S3_BUCKET=vestidos python migrate_uploads.py
+"""
+import argparse
+import os
+from pathlib import Path
+
+import storage
+
+
+def main(argv=None):
+    root = Path(__file__).parent
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', type=Path, default=Path(os.environ.get('UPLOADS_DIR', root / 'uploads')))
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be copied')
+    parser.add_argument('--sobrescrever', action='store_true', help='Copy even files already in the bucket')
+    args = parser.parse_args(argv)
+
+    os.environ['STORAGE_BACKEND'] = 's3'
+    target = storage.backend_from_env(args.dir)
+    source = storage.LocalStorage(args.dir)
+    print(f"{source} -> {target}")
+    print(storage.copy_files(source, target, overwrite=args.sobrescrever, dry_run=args.dry_run))
+
+
+if __name__ == '__main__':
+    main()
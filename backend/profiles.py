@@ -0,0 +1,108 @@
+"""Per-client rental summary, for the counter's "is this a good client?".
+
+``cliente_stats`` keeps, per client, the lifetime number of rentals, the
+total paid, the outstanding balance (``valor_aluguel - valor_pago`` over
+their rentals; finishing a rental settles it), late returns and the last
+visit (the latest rental's ``created_at_ts``). As with analytics.py, the
+write handlers in server.py maintain it in the same transaction as the
+rental change, so a profile is one primary key read however long the
+client's history is, and ``rebuild`` runs periodically to correct drift.
+Archived rentals stay counted.
+"""
+
+
+async def create_tables(db, alugueis: str = 'alugueis'):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS cliente_stats (
+            cliente_id TEXT PRIMARY KEY,
+            total_alugueis INTEGER DEFAULT 0,
+            total_pago REAL DEFAULT 0,
+            saldo_devedor REAL DEFAULT 0,
+            devolucoes_atrasadas INTEGER DEFAULT 0,
+            ultima_visita_ts INTEGER
+        )
+    ''')
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM cliente_stats), EXISTS (SELECT 1 FROM clientes)")
+    has_stats, has_clientes = await cursor.fetchone()
+    if has_clientes and not has_stats:
+        await rebuild(db, alugueis)
+
+
+async def rebuild(db, alugueis: str = 'alugueis'):
+    """Recomputes every profile in one transaction; ``alugueis`` may be a subquery including the archive."""
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await db.execute("DELETE FROM cliente_stats")
+        await db.execute(f'''
+            INSERT INTO cliente_stats (cliente_id, total_alugueis, total_pago, saldo_devedor,
+                                       devolucoes_atrasadas, ultima_visita_ts)
+            SELECT c.id, COUNT(a.id), COALESCE(SUM(a.valor_pago), 0),
+                   COALESCE(SUM(COALESCE(a.valor_aluguel, 0) - COALESCE(a.valor_pago, 0)), 0),
+                   COALESCE(SUM(a.atrasado), 0), MAX(a.created_at_ts)
+            FROM clientes c
+            LEFT JOIN {alugueis} a ON a.cliente_id = c.id
+            GROUP BY c.id
+        ''')
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+
+async def on_aluguel(db, cliente_id: str, valor_aluguel: float, valor_pago: float, atrasado: int,
+                     created_at_ts: int, sinal: int = 1):
+    """Adds (sinal=1) or removes (sinal=-1, after deleting the row) one rental from its client's profile."""
+    pago = valor_pago or 0
+    saldo = (valor_aluguel or 0) - pago
+    if sinal > 0:
+        await db.execute(
+            '''INSERT INTO cliente_stats (cliente_id, total_alugueis, total_pago, saldo_devedor,
+                                          devolucoes_atrasadas, ultima_visita_ts)
+               VALUES (?, 1, ?, ?, ?, ?)
+               ON CONFLICT(cliente_id) DO UPDATE SET
+                   total_alugueis = cliente_stats.total_alugueis + 1,
+                   total_pago = cliente_stats.total_pago + excluded.total_pago,
+                   saldo_devedor = cliente_stats.saldo_devedor + excluded.saldo_devedor,
+                   devolucoes_atrasadas = cliente_stats.devolucoes_atrasadas + excluded.devolucoes_atrasadas,
+                   ultima_visita_ts = MAX(COALESCE(cliente_stats.ultima_visita_ts, 0), excluded.ultima_visita_ts)''',
+            (cliente_id, pago, saldo, atrasado or 0, created_at_ts)
+        )
+        return
+    # The last visit may have been the deleted rental; found again through idx_alugueis_cliente_created
+    await db.execute(
+        '''UPDATE cliente_stats SET
+               total_alugueis = total_alugueis - 1,
+               total_pago = total_pago - ?,
+               saldo_devedor = saldo_devedor - ?,
+               devolucoes_atrasadas = devolucoes_atrasadas - ?,
+               ultima_visita_ts = (SELECT MAX(created_at_ts) FROM alugueis WHERE cliente_id = ?)
+           WHERE cliente_id = ?''',
+        (pago, saldo, atrasado or 0, cliente_id, cliente_id)
+    )
+
+
+async def on_pagamento(db, cliente_id: str, delta: float):
+    """Records a change in a rental's valor_pago."""
+    if not delta:
+        return
+    await db.execute(
+        "UPDATE cliente_stats SET total_pago = total_pago + ?, saldo_devedor = saldo_devedor - ? WHERE cliente_id = ?",
+        (delta, delta, cliente_id)
+    )
+
+
+async def on_atraso(db, cliente_ids: list):
+    """One late return for each entry (a client appears once per rental that became overdue)."""
+    await db.executemany(
+        "UPDATE cliente_stats SET devolucoes_atrasadas = devolucoes_atrasadas + 1 WHERE cliente_id = ?",
+        [(cliente_id,) for cliente_id in cliente_ids]
+    )
+
+
+async def fetch(db, cliente_id: str):
+    cursor = await db.execute(
+        '''SELECT total_alugueis, total_pago, saldo_devedor, devolucoes_atrasadas, ultima_visita_ts
+           FROM cliente_stats WHERE cliente_id = ?''',
+        (cliente_id,)
+    )
+    return await cursor.fetchone()
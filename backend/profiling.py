@@ -0,0 +1,294 @@
+"""On-demand profiles of single requests, for diagnosing slow routes in production.
+
+``ProfilingMiddleware`` profiles a request when it carries the profiling
+header and ``authorize`` accepts it (server.py: admins only), or at random
+for a ``sample_rate`` fraction of requests. Otherwise it costs one header
+scan per request and nothing else is armed.
+
+While at least one profiled request is running, a CPU timer (SIGPROF every
+``interval`` seconds of process CPU time) interrupts the event loop thread
+and the handler records the Python stack, if the code it interrupted runs
+in a profiled request's context. Tasks inherit the context of the code that
+created them, so work a handler hands to another task is counted too; code
+running in other threads (sync routes, aiosqlite) is not sampled, but
+database calls made through ``get_db`` are timed separately: while a
+profile is active ``timed`` wraps the connection and records each call's
+wall time under the stack that awaited it, below a ``[db] <statement>``
+frame.
+
+The last ``keep`` profiles are kept in memory. ``Profile.folded()`` gives
+them in the folded stacks format read by flamegraph.pl, speedscope and
+inferno (``frame;frame;frame weight`` per line), weighted in microseconds:
+CPU samples and database waits share the same unit and can be compared.
+"""
+import asyncio
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+# The profile of the request running in the current context
+_active: ContextVar = ContextVar('profile', default=None)
+# Stacks start below these: event loop callbacks (frames above are the loop
+# itself) and ProfilingMiddleware (frames above are the server and outer middleware)
+_ROOTS = {asyncio.events.Handle._run.__code__}
+MAX_DEPTH = 128
+
+
+def active() -> bool:
+    return _active.get() is not None
+
+
+def _stack(frame) -> tuple:
+    """Frames from the request (or task) root down to ``frame``, as ``function (file:line)``."""
+    frames = []
+    while frame is not None and frame.f_code not in _ROOTS and len(frames) < MAX_DEPTH:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+def _statement(sql: str) -> str:
+    return ' '.join(str(sql).split())[:80].replace(';', ',')
+
+
+class Profile:
+    def __init__(self, method: str, path: str, query: str, reason: str, interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = f"{method} {path}"
+        self.query = query
+        self.reason = reason
+        self.interval_us = int(interval * 1e6)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration = 0.0
+        self.status = None
+        self.samples = 0
+        self.db_time = 0.0
+        self.db_calls = 0
+        # stack (root first) -> microseconds
+        self.stacks: Counter = Counter()
+
+    def sample(self, frame):
+        self.samples += 1
+        self.stacks[_stack(frame)] += self.interval_us
+
+    @contextmanager
+    def db(self, sql: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.db_calls += 1
+            # Skips the timing wrappers themselves
+            stack = _stack(sys._getframe(3))
+            self.stacks[stack + (f"[db] {_statement(sql)}",)] += int(elapsed * 1e6)
+
+    def finish(self, status: Optional[int]):
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'rota': self.route,
+            'consulta': self.query,
+            'motivo': self.reason,
+            'inicio': self.started_at,
+            'status': self.status,
+            'duracao_ms': round(self.duration * 1000, 1),
+            'cpu_ms': round(self.samples * self.interval_us / 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'consultas_db': self.db_calls,
+        }
+
+    def folded(self) -> str:
+        lines = []
+        for stack, weight in self.stacks.most_common():
+            if weight:
+                frames = ';'.join(frame.replace(';', ',') for frame in stack)
+                lines.append(f"{self.route};{frames} {weight}" if frames else f"{self.route} {weight}")
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    def __init__(self, authorize: Callable[[dict], Awaitable[bool]], header: str = 'x-profile',
+                 sample_rate: float = 0.0, keep: int = 20, interval: float = 0.005):
+        self.authorize = authorize
+        self.header = header.lower().encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.profiles = deque(maxlen=keep)
+        self._running = 0
+        self._cpu = hasattr(signal, 'setitimer')
+        self._installed = False
+
+    async def reason(self, scope) -> Optional[str]:
+        """Why this request should be profiled, or None."""
+        for name, _ in scope['headers']:
+            if name == self.header:
+                if await self.authorize(scope):
+                    return 'cabecalho'
+                break
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'amostragem'
+        return None
+
+    def _arm(self):
+        if not self._cpu:
+            return
+        if not self._installed:
+            # Signal handlers can only be set from the main thread, where uvicorn runs the loop
+            if threading.current_thread() is not threading.main_thread():
+                logging.warning("Profiling without CPU samples: the event loop is not in the main thread")
+                self._cpu = False
+                return
+            signal.signal(signal.SIGPROF, _on_sigprof)
+            self._installed = True
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def start(self, scope, reason: str) -> Profile:
+        profile = Profile(scope['method'], scope['path'], scope.get('query_string', b'').decode('latin-1'),
+                          reason, self.interval)
+        self._running += 1
+        if self._running == 1:
+            self._arm()
+        return profile
+
+    def finish(self, profile: Profile, status: Optional[int]):
+        self._running -= 1
+        if self._running == 0 and self._installed:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+        profile.finish(status)
+        self.profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def metrics(self) -> dict:
+        return {
+            'guardados': len(self.profiles),
+            'capacidade': self.profiles.maxlen,
+            'em_andamento': self._running,
+            'amostragem': self.sample_rate,
+            'intervalo_ms': self.interval * 1000,
+            'cpu': self._cpu,
+        }
+
+
+def _on_sigprof(signum, frame):
+    # Runs on the main thread in the context of the interrupted code
+    profile = _active.get()
+    if profile is not None:
+        profile.sample(frame)
+
+
+class ProfilingMiddleware:
+    """Profiles the requests ``profiler`` picks and adds ``X-Profile-Id`` to their responses."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        reason = await self.profiler.reason(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+        profile = self.profiler.start(scope, reason)
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message = {**message, 'headers': [*message.get('headers', []), (b'x-profile-id', profile.id.encode())]}
+            await send(message)
+
+        token = _active.set(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _active.reset(token)
+            self.profiler.finish(profile, status)
+
+
+_ROOTS.add(ProfilingMiddleware.__call__.__code__)
+
+
+def timed(connect):
+    """``connect`` (an unopened connection, used with ``async with``) timing its calls into the active profile."""
+    return _TimedConnect(connect, _active.get())
+
+
+class _TimedConnect:
+    def __init__(self, connect, profile: Profile):
+        self._connect = connect
+        self._profile = profile
+
+    async def __aenter__(self):
+        return TimedConnection(await self._connect.__aenter__(), self._profile)
+
+    async def __aexit__(self, *exc):
+        return await self._connect.__aexit__(*exc)
+
+
+class TimedConnection:
+    def __init__(self, db, profile: Profile):
+        object.__setattr__(self, '_db', db)
+        object.__setattr__(self, '_profile', profile)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        # e.g. row_factory
+        setattr(self._db, name, value)
+
+    async def execute(self, sql, *args, **kwargs):
+        with self._profile.db(sql):
+            cursor = await self._db.execute(sql, *args, **kwargs)
+        return TimedCursor(cursor, self._profile, sql)
+
+    async def executemany(self, sql, *args, **kwargs):
+        with self._profile.db(sql):
+            return await self._db.executemany(sql, *args, **kwargs)
+
+    async def commit(self):
+        with self._profile.db('COMMIT'):
+            return await self._db.commit()
+
+    async def rollback(self):
+        with self._profile.db('ROLLBACK'):
+            return await self._db.rollback()
+
+
+class TimedCursor:
+    def __init__(self, cursor, profile: Profile, sql: str):
+        self._cursor = cursor
+        self._profile = profile
+        self._sql = sql
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def fetchone(self):
+        with self._profile.db(self._sql):
+            return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        with self._profile.db(self._sql):
+            return await self._cursor.fetchall()
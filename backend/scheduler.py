@@ -0,0 +1,185 @@
+"""In-process periodic job runner for the API.
+
+Every worker process starts a Scheduler, but only the one holding the lease
+row in ``scheduler_lease`` runs jobs, so scaling out to several uvicorn
+workers (sharing the same database) does not run housekeeping N times. The
+lease expires if its holder dies, and another worker takes over on its next
+tick. The leader renews the lease while a job runs, so a job slower than
+the lease does not let a second worker start the same jobs.
+
+When each job last ran is kept in ``scheduler_jobs``, so a restart (or a
+scale-to-zero wake) does not rerun every job at once: a job runs when its
+interval has passed since its last run in any worker. A job that never ran
+gets a random last run within its interval, spreading the first runs.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        # Loaded from scheduler_jobs when this worker becomes the leader
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+
+    def is_due(self, now: float) -> bool:
+        return self.last_run is not None and now - self.last_run >= self.interval
+
+
+class Scheduler:
+    def __init__(self, connect, tick: float = 5.0, lease_seconds: float = 60.0):
+        self.connect = connect
+        self.tick = tick
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self.is_leader = False
+        self._task = None
+
+    def add_job(self, name: str, interval: float, func):
+        """Registers ``func`` (an async callable without arguments) to run every ``interval`` seconds."""
+        self.jobs[name] = Job(name, interval, func)
+
+    async def start(self):
+        async with self.connect() as db:
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS scheduler_lease (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    holder TEXT,
+                    expires_at REAL
+                )
+            ''')
+            await db.execute("INSERT OR IGNORE INTO scheduler_lease (id, holder, expires_at) VALUES (1, '', 0)")
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS scheduler_jobs (
+                    name TEXT PRIMARY KEY,
+                    last_run REAL
+                )
+            ''')
+            await db.commit()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            async with self.connect() as db:
+                await db.execute(
+                    "UPDATE scheduler_lease SET holder = '', expires_at = 0 WHERE id = 1 AND holder = ?",
+                    (self.worker_id,)
+                )
+                await db.commit()
+            self.is_leader = False
+
+    async def acquire_lease(self) -> bool:
+        """Takes or renews the lease; True if this worker is the leader until the next tick."""
+        now = time.time()
+        async with self.connect() as db:
+            cursor = await db.execute(
+                '''UPDATE scheduler_lease SET holder = ?, expires_at = ?
+                   WHERE id = 1 AND (holder = ? OR expires_at < ?)''',
+                (self.worker_id, now + self.lease_seconds, self.worker_id, now)
+            )
+            await db.commit()
+            return cursor.rowcount == 1
+
+    async def load_last_runs(self):
+        now = time.time()
+        async with self.connect() as db:
+            cursor = await db.execute("SELECT name, last_run FROM scheduler_jobs")
+            last_runs = dict(await cursor.fetchall())
+        for job in self.jobs.values():
+            job.last_run = last_runs.get(job.name)
+            if job.last_run is None:
+                job.last_run = now - random.uniform(0, job.interval)
+
+    async def _save_last_run(self, job: Job):
+        async with self.connect() as db:
+            await db.execute(
+                '''INSERT INTO scheduler_jobs (name, last_run) VALUES (?, ?)
+                   ON CONFLICT(name) DO UPDATE SET last_run = excluded.last_run''',
+                (job.name, job.last_run)
+            )
+            await db.commit()
+
+    async def _renew_lease(self):
+        """Keeps the lease while a job runs."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                self.is_leader = await self.acquire_lease()
+            except Exception:
+                logger.exception("Scheduler lease renewal failed")
+            if not self.is_leader:
+                logger.warning("Scheduler %s lost leadership during a job", self.worker_id)
+
+    async def run_job(self, job: Job):
+        started = time.monotonic()
+        job.last_run = time.time()
+        renewal = asyncio.create_task(self._renew_lease())
+        try:
+            await job.func()
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            logger.exception("Scheduled job %s failed", job.name)
+        finally:
+            renewal.cancel()
+        job.last_duration = time.monotonic() - started
+        job.runs += 1
+        await self._save_last_run(job)
+
+    async def _loop(self):
+        while True:
+            try:
+                was_leader = self.is_leader
+                self.is_leader = await self.acquire_lease()
+                if self.is_leader != was_leader:
+                    logger.info("Scheduler %s %s leadership", self.worker_id, "took" if self.is_leader else "lost")
+                if self.is_leader and not was_leader:
+                    await self.load_last_runs()
+                if self.is_leader:
+                    for job in list(self.jobs.values()):
+                        if job.is_due(time.time()):
+                            await self.run_job(job)
+                        # Renewed during the job; another worker may hold it after a failed renewal
+                        if not self.is_leader:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(self.tick)
+
+    def status(self) -> dict:
+        return {
+            'worker_id': self.worker_id,
+            'is_leader': self.is_leader,
+            'jobs': {
+                job.name: {
+                    'interval': job.interval,
+                    'runs': job.runs,
+                    'last_run': job.last_run,
+                    'last_duration': job.last_duration,
+                    'last_error': job.last_error,
+                }
+                for job in self.jobs.values()
+            },
+        }
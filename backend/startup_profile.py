@@ -0,0 +1,178 @@
+"""Cold start measurements.
+
+Hosts that scale to zero stop the app when it is idle, so the first request
+after a wake-up waits for the interpreter, the imports and the startup hook.
+``StartupProfile`` records how long each of those phases took and when the
+first response went out; GET /api/ready and /api/metrics report it.
+
+Run this file to see where the time goes: it imports the app with
+``-X importtime`` in a fresh interpreter, runs the startup hook once and
+prints the slowest imports by cumulative time and the startup phases.
+The app runs in a temporary directory, against a copy of ``--db`` (by
+default DATABASE_PATH) or an empty database if that file does not exist,
+so the real data is never touched.
+
+    cd backend
+    python startup_profile.py
+    python startup_profile.py --top 40 --db /tmp/bench.db
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started (Linux only), so interpreter and uvicorn startup count too."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name, which may contain spaces; starttime is field 22
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'), 3)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """Created first thing in server.py; phases are in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Interpreter and server startup before the app module began importing
+        self.before_import = process_age()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.first_response: Optional[float] = None
+
+    def mark(self, phase: str):
+        """Records the time since the profile was created, e.g. at the end of the imports."""
+        self.phases[phase] = round(time.perf_counter() - self.started, 4)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 4)
+
+    def responded(self):
+        if self.first_response is None:
+            self.first_response = round((self.before_import or 0) + time.perf_counter() - self.started, 4)
+            logging.info("First response %.3fs after process start", self.first_response)
+
+    def report(self) -> dict:
+        return {
+            'pronto': self.ready,
+            'antes_da_importacao': self.before_import,
+            'fases': self.phases,
+            'primeira_resposta': self.first_response,
+        }
+
+
+class FirstResponse:
+    """ASGI middleware telling ``profile`` when the first HTTP response starts; a no-op afterwards."""
+
+    def __init__(self, app, profile: StartupProfile):
+        self.app = app
+        self.profile = profile
+
+    async def __call__(self, scope, receive, send):
+        if self.profile.first_response is not None or scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_and_note(message):
+            if message['type'] == 'http.response.start':
+                self.profile.responded()
+            await send(message)
+
+        await self.app(scope, receive, send_and_note)
+
+
+PROBE = '''
+import asyncio, json, server
+
+async def main():
+    await server.startup()
+    await server.app.state.warm_up
+    await server.shutdown()
+    print(json.dumps(server.startup_profile.report()))
+
+asyncio.run(main())
+'''
+
+
+def parse_importtime(stderr: str) -> List[tuple]:
+    """(cumulative_us, self_us, depth, module) per line of ``-X importtime`` output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(cumulative), int(own), depth, name.strip()))
+    return imports
+
+
+def scratch_env(tmp: Path, source: Path) -> Dict[str, str]:
+    """Settings pointing every file the app writes into ``tmp``, with a copy of ``source`` as its database."""
+    database = tmp / 'database.db'
+    if source.exists():
+        # The backup API gives a consistent copy even while the app is writing to the source
+        with sqlite3.connect(source) as src, sqlite3.connect(database) as dst:
+            src.backup(dst)
+    return {
+        'DATABASE_PATH': str(database),
+        'ARCHIVE_PATH': str(tmp / 'database-arquivo.db'),
+        # Empty values override a .env file; a single store on the SQLite copy
+        'DATABASE_URL': '',
+        'LOJAS': '',
+        'LOJAS_DIR': str(tmp / 'lojas'),
+        'UPLOADS_DIR': str(tmp / 'uploads'),
+        'BACKUP_DIR': str(tmp / 'backups'),
+        'CONTRATOS_DIR': str(tmp / 'contratos'),
+        'SCHEDULER_ENABLED': '0',
+    }
+
+
+def main(argv=None):
+    backend_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=25, help='Number of imports to list')
+    parser.add_argument('--db', default=os.environ.get('DATABASE_PATH', backend_dir / 'database.db'),
+                        help='SQLite database to copy and start against (never modified)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, **scratch_env(Path(tmp), Path(args.db))}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=backend_dir, env=env, capture_output=True, text=True,
+        )
+        total = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    imports = parse_importtime(result.stderr)
+    print(f"{'cumulativo':>10} {'próprio':>9}  módulo")
+    for cumulative, own, depth, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:8.1f}ms {own / 1000:7.1f}ms  {'  ' * depth}{name}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"\nAntes da importação: {report['antes_da_importacao']}s")
+    for name, seconds in report['fases'].items():
+        print(f"{name:>24}: {seconds * 1000:8.1f}ms")
+    print(f"{'processo inteiro':>24}: {total * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,454 @@
+"""Content-addressed storage for uploaded photos.
+
+Files are named by the sha256 of their content, so uploading the same photo
+twice stores it once. The ``arquivos`` table keeps a reference count per file
+that mirrors how many ``vestido_fotos`` rows point at it; files whose count
+drops to zero are removed by ``collect_garbage``.
+
+Where the bytes live is up to a backend: ``LocalStorage`` keeps them in a
+directory served by the app, ``S3Storage`` in an S3-compatible bucket (AWS,
+MinIO, R2...) that clients download from directly through presigned or
+public URLs. ``backend_from_env`` picks one from STORAGE_BACKEND.
+
+Resized derivatives (thumbnails) are generated lazily, on first request, under
+``derivados/`` and are removed together with their original.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+URL_PREFIX = '/uploads/'
+DERIVADOS_DIR = 'derivados'
+# Only these widths are generated, so clients cannot fill the disk with sizes
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+# S3 uploads above this size go up in parts of this size
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp',
+    'gif': 'image/gif', 'avif': 'image/avif', 'heic': 'image/heic',
+}
+
+
+class StoredFile(NamedTuple):
+    hash: str
+    nome: str
+    tamanho: int
+    largura: Optional[int] = None
+    altura: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return f"{URL_PREFIX}{self.nome}"
+
+
+class LocalStorage:
+    """Files in a local directory, served by the app's StaticFiles mount."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f"LocalStorage({self.root})"
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    def url(self, key: str) -> str:
+        return f"{URL_PREFIX}{key}"
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            st = (self.root / key).stat()
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def put(self, tmp_path: Path, key: str):
+        """Moves a finished temp file into place; an existing copy is only touched."""
+        target = self.root / key
+        if target.exists():
+            # Refresh mtime so a concurrent GC run treats it as new
+            os.utime(target)
+            tmp_path.unlink(missing_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[Path]:
+        path = self.root / key
+        if not path.is_file():
+            raise FileNotFoundError(key)
+        yield path
+
+    def delete(self, key: str):
+        (self.root / key).unlink(missing_ok=True)
+
+    def scan(self) -> Dict[str, Tuple[int, float]]:
+        """Originals (not derivatives or temp files) with their size and mtime."""
+        files = {}
+        for path in self.root.iterdir():
+            if path.is_file() and not path.name.startswith('.'):
+                st = path.stat()
+                files[path.name] = (st.st_size, st.st_mtime)
+        return files
+
+    def derivatives(self, nome: str) -> List[str]:
+        stem = nome.rpartition('.')[0]
+        return [f"{DERIVADOS_DIR}/{p.name}" for p in (self.root / DERIVADOS_DIR).glob(f"{stem}_w*")]
+
+    def temp_dir(self) -> Path:
+        # Same filesystem as the target, so put() is an atomic rename
+        return self.root
+
+
+class S3Storage:
+    """Files in an S3-compatible bucket; clients fetch them from the bucket directly.
+
+    ``public_url`` (a CDN or public bucket base URL) is used for redirects when
+    set; otherwise URLs are presigned for ``presign_seconds``.
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, public_url: Optional[str] = None, presign_seconds: int = 3600):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.presign_seconds = presign_seconds
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_SIZE, multipart_chunksize=MULTIPART_CHUNK_SIZE
+        )
+
+    def __repr__(self):
+        return f"S3Storage(s3://{self.bucket}/{self.prefix})"
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{self._key(key)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)}, ExpiresIn=self.presign_seconds
+        )
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return head['ContentLength'], head['LastModified'].timestamp()
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def put(self, tmp_path: Path, key: str):
+        try:
+            if self.exists(key):
+                # Copying onto itself refreshes LastModified, which GC uses like an mtime
+                self.client.copy_object(
+                    Bucket=self.bucket, Key=self._key(key), CopySource={'Bucket': self.bucket, 'Key': self._key(key)},
+                    MetadataDirective='REPLACE', ContentType=content_type(key), CacheControl=IMMUTABLE,
+                )
+            else:
+                self.client.upload_file(
+                    str(tmp_path), self.bucket, self._key(key), Config=self.transfer_config,
+                    ExtraArgs={'ContentType': content_type(key), 'CacheControl': IMMUTABLE},
+                )
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[Path]:
+        from botocore.exceptions import ClientError
+
+        fd, name = tempfile.mkstemp(suffix=Path(key).suffix)
+        os.close(fd)
+        path = Path(name)
+        try:
+            try:
+                self.client.download_file(self.bucket, self._key(key), name, Config=self.transfer_config)
+            except ClientError as e:
+                if self._is_missing(e):
+                    raise FileNotFoundError(key)
+                raise
+            yield path
+        finally:
+            path.unlink(missing_ok=True)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def _list(self, prefix: str):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix), Delimiter='/'):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):], obj
+
+    def scan(self) -> Dict[str, Tuple[int, float]]:
+        return {
+            key: (obj['Size'], obj['LastModified'].timestamp())
+            for key, obj in self._list('') if not key.startswith('.')
+        }
+
+    def derivatives(self, nome: str) -> List[str]:
+        return [key for key, _ in self._list(f"{DERIVADOS_DIR}/{nome.rpartition('.')[0]}_w")]
+
+    def temp_dir(self) -> Optional[Path]:
+        return None
+
+
+def content_type(nome: str) -> str:
+    return CONTENT_TYPES.get(nome.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+
+
+def backend_from_env(uploads_dir: Path):
+    """STORAGE_BACKEND=local (default, files in ``uploads_dir``) or s3 (S3_* variables)."""
+    kind = os.environ.get('STORAGE_BACKEND', 'local')
+    if kind == 'local':
+        return LocalStorage(uploads_dir)
+    if kind == 's3':
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', ''),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            region=os.environ.get('S3_REGION') or None,
+            public_url=os.environ.get('S3_PUBLIC_URL') or None,
+            presign_seconds=int(os.environ.get('S3_PRESIGN_SECONDS', 3600)),
+        )
+    raise ValueError(f"STORAGE_BACKEND desconhecido: {kind}")
+
+
+def safe_extension(filename: str) -> str:
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return ext if re.fullmatch(r'[a-z0-9]{1,5}', ext) else 'bin'
+
+
+def nome_from_url(url: str) -> str:
+    return url.rsplit('/', 1)[-1]
+
+
+def image_size(path: Path) -> Tuple[Optional[int], Optional[int]]:
+    """(width, height) read from the image header, or (None, None) if it is not an image."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except (UnidentifiedImageError, OSError):
+        return None, None
+
+
+def file_info(backend, nome: str) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """(size, width, height) of a stored file; all None if it is missing. Blocking (downloads it on S3)."""
+    try:
+        with backend.fetch(nome) as path:
+            return (path.stat().st_size, *image_size(path))
+    except FileNotFoundError:
+        return None, None, None
+
+
+def store_file(fileobj, backend, filename: str) -> StoredFile:
+    """Streams ``fileobj`` into ``backend`` under its content hash.
+
+    The content is hashed while it is spooled to a temp file in chunks, then
+    handed to the backend (a rename locally, a multipart upload on S3).
+    Blocking; call it through ``asyncio.to_thread``.
+    """
+    digest = hashlib.sha256()
+    tamanho = 0
+    fd, name = tempfile.mkstemp(prefix='.tmp-', dir=backend.temp_dir())
+    tmp_path = Path(name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+                tamanho += len(chunk)
+        file_hash = digest.hexdigest()
+        nome = f"{file_hash}.{safe_extension(filename)}"
+        largura, altura = image_size(tmp_path)
+        backend.put(tmp_path, nome)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return StoredFile(file_hash, nome, tamanho, largura, altura)
+
+
+def derivative_key(nome: str, largura: int) -> str:
+    stem, _, ext = nome.rpartition('.')
+    return f"{DERIVADOS_DIR}/{stem}_w{largura}.{ext}"
+
+
+def make_derivative(backend, nome: str, largura: int) -> str:
+    """Returns the key of ``nome`` resized to ``largura`` px wide, creating it if needed.
+
+    Blocking; call it through ``asyncio.to_thread``. Raises FileNotFoundError
+    for unknown files and ValueError when the file is not a readable image.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    key = derivative_key(nome, largura)
+    if backend.exists(key):
+        return key
+    if '/' in nome or nome.startswith('.'):
+        raise FileNotFoundError(nome)
+    fd, name = tempfile.mkstemp(prefix='.tmp-', suffix=Path(nome).suffix, dir=backend.temp_dir())
+    os.close(fd)
+    tmp_path = Path(name)
+    try:
+        with backend.fetch(nome) as source, Image.open(source) as img:
+            img_format = img.format
+            if img.width > largura:
+                img.thumbnail((largura, img.height * largura // img.width + 1))
+            img.save(tmp_path, format=img_format)
+        backend.put(tmp_path, key)
+    except UnidentifiedImageError as e:
+        raise ValueError(str(e))
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return key
+
+
+async def add_refs(db, files: List[StoredFile]):
+    now = time.time()
+    for stored in files:
+        await db.execute(
+            '''INSERT INTO arquivos (nome, hash, tamanho, referencias, created_at) VALUES (?, ?, ?, 1, ?)
+               ON CONFLICT(nome) DO UPDATE SET referencias = arquivos.referencias + 1''',
+            (stored.nome, stored.hash, stored.tamanho, now)
+        )
+
+
+async def release_refs(db, urls: List[str]):
+    for url in urls:
+        await db.execute(
+            "UPDATE arquivos SET referencias = MAX(referencias - 1, 0) WHERE nome = ?",
+            (nome_from_url(url),)
+        )
+
+
+def _remove_files(backend, nomes: List[str], cutoff: float) -> List[str]:
+    removed = []
+    for nome in nomes:
+        # Re-check: a duplicate upload may have touched it since the scan
+        stat = backend.stat(nome)
+        if stat is None:
+            continue
+        if stat[1] < cutoff:
+            backend.delete(nome)
+            removed.append(nome)
+        for derivative in backend.derivatives(nome):
+            backend.delete(derivative)
+    return removed
+
+
+async def collect_garbage(dbs: List, backend, dry_run: bool = True, grace_seconds: float = 3600) -> dict:
+    """Removes files no dress references in any of ``dbs`` (one connection per store).
+
+    Reference counts are first reconciled against ``vestido_fotos``, which
+    stays the source of truth. Files younger than ``grace_seconds`` are kept,
+    since uploads are written before their dress row is committed. Legacy
+    uuid-named files without an ``arquivos`` row are collected the same way.
+    """
+    referenced = Counter()
+    per_db = []
+    for db in dbs:
+        # One statement, so the photos and the counts are read from the same snapshot
+        cursor = await db.execute('''
+            SELECT 'foto', url, COUNT(*) FROM vestido_fotos GROUP BY url
+            UNION ALL
+            SELECT 'arquivo', nome, referencias FROM arquivos
+        ''')
+        local = Counter()
+        rows = []
+        for fonte, chave, count in await cursor.fetchall():
+            if fonte == 'foto':
+                local[nome_from_url(chave)] += count
+            else:
+                rows.append((chave, count))
+        referenced += local
+        # (count, nome, count read): only written if no add_refs/release_refs changed the row since
+        drifted = [(local[nome], nome, referencias) for nome, referencias in rows if local[nome] != referencias]
+        per_db.append((db, rows, drifted))
+
+    stored = await asyncio.to_thread(backend.scan)
+    cutoff = time.time() - grace_seconds
+    candidates = sorted(
+        nome for nome, (_, mtime) in stored.items()
+        if referenced[nome] == 0 and mtime < cutoff
+    )
+    report = {
+        'dry_run': dry_run,
+        'arquivos': len(candidates),
+        'bytes': sum(stored[nome][0] for nome in candidates),
+        'referencias_corrigidas': sum(len(drifted) for _, _, drifted in per_db),
+        'itens': [{'nome': nome, 'tamanho': stored[nome][0]} for nome in candidates],
+    }
+    if dry_run:
+        return report
+
+    removed = await asyncio.to_thread(_remove_files, backend, candidates, cutoff)
+    for db, rows, drifted in per_db:
+        if drifted:
+            await db.executemany("UPDATE arquivos SET referencias = ? WHERE nome = ? AND referencias = ?", drifted)
+        missing = [(nome,) for nome, _ in rows if referenced[nome] == 0 and nome not in stored]
+        await db.executemany("DELETE FROM arquivos WHERE nome = ? AND referencias = 0", [(nome,) for nome in removed] + missing)
+        await db.commit()
+    report['arquivos'] = len(removed)
+    report['bytes'] = sum(stored[nome][0] for nome in removed)
+    report['itens'] = [{'nome': nome, 'tamanho': stored[nome][0]} for nome in removed]
+    return report
+
+
+def copy_files(source, target, overwrite: bool = False, dry_run: bool = False) -> dict:
+    """Copies every original from ``source`` to ``target``, skipping ones already there with the same size.
+
+    Derivatives are not copied; the target regenerates them on demand.
+    """
+    copied, skipped, total_bytes = [], [], 0
+    target_existing = target.scan()
+    for nome, (tamanho, _) in sorted(source.scan().items()):
+        if not overwrite and target_existing.get(nome, (None,))[0] == tamanho:
+            skipped.append(nome)
+            continue
+        if not dry_run:
+            fd, name = tempfile.mkstemp(prefix='.tmp-', dir=target.temp_dir())
+            os.close(fd)
+            tmp_path = Path(name)
+            try:
+                with source.fetch(nome) as path:
+                    shutil.copyfile(path, tmp_path)
+                target.put(tmp_path, nome)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+        copied.append(nome)
+        total_bytes += tamanho
+    return {'copiados': len(copied), 'ignorados': len(skipped), 'bytes': total_bytes, 'dry_run': dry_run}
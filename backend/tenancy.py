@@ -0,0 +1,66 @@
+"""Routing of requests to per-store databases.
+
+Each store (``loja``) has its own database: an SQLite file, or a PostgreSQL
+database with its own connection pool (see database.py). Stores never
+contend on each other's write lock, and a busy one cannot stall the rest.
+
+The store of the current request is kept in a context variable. It is set
+by ``get_current_user`` from the ``loja`` claim of the JWT, and
+``Lojas.connect()`` opens a connection to that store. Code outside a
+request, such as startup and scheduled jobs, runs once per store inside
+``scope(loja)``.
+"""
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import database
+
+LOJA_ID = re.compile(r'[a-z0-9][a-z0-9_-]{0,39}')
+
+_current: ContextVar[Optional[str]] = ContextVar('loja', default=None)
+
+
+class Lojas:
+    """The configured stores and their database backends; the first one is the default."""
+
+    def __init__(self, targets: Dict[str, object], pool_max_size: int = database.POOL_MAX_SIZE):
+        for loja in targets:
+            if not LOJA_ID.fullmatch(loja):
+                raise ValueError(f"Identificador de loja inválido: {loja!r}")
+        self.padrao = next(iter(targets))
+        self.backends = {
+            loja: database.open_database(target, pool_max_size=pool_max_size) for loja, target in targets.items()
+        }
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self.backends)
+
+    def current(self) -> str:
+        return _current.get() or self.padrao
+
+    def backend(self, loja: Optional[str] = None):
+        return self.backends[loja or self.current()]
+
+    def connect(self, loja: Optional[str] = None):
+        return self.backend(loja).connect()
+
+    def activate(self, loja: str):
+        """Makes ``loja`` current for the rest of the running task (one request)."""
+        if loja not in self.backends:
+            raise KeyError(loja)
+        _current.set(loja)
+
+    @contextmanager
+    def scope(self, loja: str):
+        token = _current.set(loja)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
@@ -173,7 +173,7 @@ class VestidosAPITester:
             'vestido_id': self.created_vestido_id,
             'cliente': {
                 'nome_completo': 'Cliente de Teste',
-                'cpf': '123.456.789-00',
+                'cpf': '123.456.789-09',
                 'telefone': '(11) 99999-9999',
                 'endereco': 'Rua de Teste, 123'
             },
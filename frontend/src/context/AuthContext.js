@@ -1,8 +1,15 @@
-import React, { createContext, useContext, useState, useEffect } from 'react';
+import React, { createContext, useContext, useState, useEffect, useRef, useCallback } from 'react';
 import axios from 'axios';
 
 const AuthContext = createContext(null);
 
+// Topics a change is published to; mirrors topicos_da_mudanca in backend/server.py
+const topicsOf = (entidade, id) => (
+  entidade === 'vestido'
+    ? ['dashboard', 'vestidos', `vestido:${id}`]
+    : ['dashboard', 'alugueis', `aluguel:${id}`]
+);
+
 export const useAuth = () => {
   const context = useContext(AuthContext);
   if (!context) {
@@ -11,11 +18,26 @@ export const useAuth = () => {
   return context;
 };
 
+// Bumps on every change published to topics, e.g. useSubscription([`vestido:${id}`]);
+// use it as an effect dependency to refetch
+export const useSubscription = (topics) => {
+  const { subscribe } = useAuth();
+  const [version, setVersion] = useState(0);
+  const key = topics.join(',');
+
+  useEffect(() => subscribe(topics, () => setVersion(v => v + 1)), [key, subscribe]);
+
+  return version;
+};
+
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [loading, setLoading] = useState(true);
-  const [refreshVersion, setRefreshVersion] = useState(0);
+  const [reconnects, setReconnects] = useState(0);
+  const wsRef = useRef(null);
+  // topic -> callbacks of the components subscribed to it
+  const listenersRef = useRef(new Map());
 
   const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
   const API = `${BACKEND_URL}/api`;
@@ -24,29 +46,79 @@ export const AuthProvider = ({ children }) => {
     if (token) {
       axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
       fetchUser();
-
-      // WebSocket for real-time updates
-      const wsUrl = API.replace('http', 'ws').replace('/api', '/ws');
-      const ws = new WebSocket(wsUrl);
-
-      ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        if (data.type === 'update') {
-          setRefreshVersion(v => v + 1);
-        }
-      };
-
-      ws.onclose = () => {
-        console.log('WS connection closed. Reconnecting in 3s...');
-        setTimeout(() => setRefreshVersion(v => v + 1), 3000);
-      };
-
-      return () => ws.close();
     } else {
       setLoading(false);
     }
   }, [token]);
 
+  const send = (message) => {
+    const ws = wsRef.current;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify(message));
+    }
+  };
+
+  // WebSocket for real-time updates, authenticated with the same token as the API;
+  // only changes to the topics subscribed by the mounted pages arrive
+  useEffect(() => {
+    if (!token) return;
+    const wsUrl = `${API.replace('http', 'ws').replace('/api', '/ws')}?token=${encodeURIComponent(token)}`;
+    const ws = new WebSocket(wsUrl);
+    wsRef.current = ws;
+    let closing = false;
+
+    ws.onopen = () => {
+      const topicos = [...listenersRef.current.keys()];
+      if (topicos.length) send({ type: 'subscribe', topicos });
+    };
+
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      let topics = [];
+      if (data.type === 'update') {
+        topics = data.mudancas.flatMap(m => topicsOf(m.entidade, m.id));
+      } else if (data.type === 'aluguel_atrasado' || data.type === 'lembrete_devolucao') {
+        topics = topicsOf('aluguel', data.aluguel_id);
+      }
+      const callbacks = new Set(topics.flatMap(t => [...(listenersRef.current.get(t) || [])]));
+      callbacks.forEach(callback => callback(data));
+    };
+
+    ws.onclose = () => {
+      if (closing) return;
+      console.log('WS connection closed. Reconnecting in 3s...');
+      setTimeout(() => setReconnects(n => n + 1), 3000);
+    };
+
+    return () => {
+      closing = true;
+      wsRef.current = null;
+      ws.close();
+    };
+  }, [token, reconnects]);
+
+  // Calls onChange for every change to any of topics; returns the unsubscribe function
+  const subscribe = useCallback((topics, onChange) => {
+    const listeners = listenersRef.current;
+    const added = topics.filter(t => !listeners.has(t));
+    topics.forEach(t => listeners.set(t, new Set([...(listeners.get(t) || []), onChange])));
+    if (added.length) send({ type: 'subscribe', topicos: added });
+
+    return () => {
+      const removed = [];
+      topics.forEach(t => {
+        const callbacks = listeners.get(t);
+        if (!callbacks) return;
+        callbacks.delete(onChange);
+        if (!callbacks.size) {
+          listeners.delete(t);
+          removed.push(t);
+        }
+      });
+      if (removed.length) send({ type: 'unsubscribe', topicos: removed });
+    };
+  }, []);
+
   const fetchUser = async () => {
     try {
       const response = await axios.get(`${API}/auth/me`);
@@ -77,7 +149,7 @@ export const AuthProvider = ({ children }) => {
   };
 
   return (
-    <AuthContext.Provider value={{ user, token, login, logout, loading, API, refreshVersion }}>
+    <AuthContext.Provider value={{ user, token, login, logout, loading, API, subscribe }}>
       {children}
     </AuthContext.Provider>
   );
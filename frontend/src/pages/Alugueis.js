@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { useAuth } from '../context/AuthContext';
+import { useAuth, useSubscription } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Button } from '../components/ui/button';
@@ -10,7 +10,8 @@ import { toast } from 'sonner';
 import { getErrorMessage } from '../lib/utils';
 
 const Alugueis = () => {
-  const { API, refreshVersion } = useAuth();
+  const { API } = useAuth();
+  const refreshVersion = useSubscription(['alugueis']);
   const navigate = useNavigate();
   const [alugueis, setAlugueis] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { useAuth } from '../context/AuthContext';
+import { useAuth, useSubscription } from '../context/AuthContext';
 import axios from 'axios';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Loader2, Package, ShoppingBag, AlertCircle, DollarSign } from 'lucide-react';
@@ -7,7 +7,8 @@ import { toast } from 'sonner';
 import { getErrorMessage } from '../lib/utils';
 
 const Dashboard = () => {
-  const { API, refreshVersion } = useAuth();
+  const { API } = useAuth();
+  const refreshVersion = useSubscription(['dashboard']);
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
 
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { useAuth } from '../context/AuthContext';
+import { useAuth, useSubscription } from '../context/AuthContext';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Button } from '../components/ui/button';
@@ -14,7 +14,8 @@ import { getErrorMessage } from '../lib/utils';
 
 const DetalhesAluguel = () => {
   const { id } = useParams();
-  const { API, refreshVersion } = useAuth();
+  const { API } = useAuth();
+  const refreshVersion = useSubscription([`aluguel:${id}`]);
   const navigate = useNavigate();
   const [loading, setLoading] = useState(true);
   const [aluguel, setAluguel] = useState(null);
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { useAuth } from '../context/AuthContext';
+import { useAuth, useSubscription } from '../context/AuthContext';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Button } from '../components/ui/button';
@@ -15,7 +15,8 @@ import { getErrorMessage } from '../lib/utils';
 
 const DetalhesVestido = () => {
   const { id } = useParams();
-  const { API, refreshVersion } = useAuth();
+  const { API } = useAuth();
+  const refreshVersion = useSubscription([`vestido:${id}`]);
   const navigate = useNavigate();
   const [loading, setLoading] = useState(true);
   const [vestido, setVestido] = useState(null);
@@ -31,11 +31,31 @@ const NovoAluguel = () => {
     forma_pagamento: '',
     observacoes: ''
   });
+  const [buscaCliente, setBuscaCliente] = useState('');
+  const [sugestoesClientes, setSugestoesClientes] = useState([]);
 
   useEffect(() => {
     fetchVestidosDisponiveis();
   }, []);
 
+  useEffect(() => {
+    if (buscaCliente.trim().length < 2) {
+      setSugestoesClientes([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/clientes/autocomplete`, {
+          params: { q: buscaCliente }
+        });
+        setSugestoesClientes(response.data);
+      } catch (error) {
+        setSugestoesClientes([]);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [buscaCliente]);
+
   const fetchVestidosDisponiveis = async () => {
     try {
       const response = await axios.get(`${API}/vestidos`, {
@@ -51,6 +71,22 @@ const NovoAluguel = () => {
     setFormData(prev => ({ ...prev, [field]: value }));
   };
 
+  const handleClienteBusca = (field, value) => {
+    handleChange(field, value);
+    setBuscaCliente(value);
+  };
+
+  const selecionarCliente = (cliente) => {
+    setFormData(prev => ({
+      ...prev,
+      cliente_nome: cliente.nome_completo,
+      cliente_cpf: cliente.cpf,
+      cliente_telefone: cliente.telefone,
+      cliente_endereco: cliente.endereco
+    }));
+    setBuscaCliente('');
+  };
+
   const handleVestidoChange = (vestidoId) => {
     const vestido = vestidos.find(v => v.id === vestidoId);
     setVestidoSelecionado(vestido);
@@ -116,7 +152,7 @@ const NovoAluguel = () => {
                   id="cliente_nome"
                   data-testid="cliente-nome-input"
                   value={formData.cliente_nome}
-                  onChange={(e) => handleChange('cliente_nome', e.target.value)}
+                  onChange={(e) => handleClienteBusca('cliente_nome', e.target.value)}
                   required
                 />
               </div>
@@ -128,7 +164,7 @@ const NovoAluguel = () => {
                   data-testid="cliente-cpf-input"
                   placeholder="000.000.000-00"
                   value={formData.cliente_cpf}
-                  onChange={(e) => handleChange('cliente_cpf', e.target.value)}
+                  onChange={(e) => handleClienteBusca('cliente_cpf', e.target.value)}
                   required
                 />
               </div>
@@ -156,6 +192,22 @@ const NovoAluguel = () => {
                 />
               </div>
             </div>
+
+            {sugestoesClientes.length > 0 && (
+              <div data-testid="cliente-sugestoes" className="border rounded-md divide-y">
+                {sugestoesClientes.map((cliente) => (
+                  <button
+                    key={cliente.id}
+                    type="button"
+                    className="w-full text-left px-3 py-2 hover:bg-gray-50"
+                    onClick={() => selecionarCliente(cliente)}
+                  >
+                    <p className="font-medium">{cliente.nome_completo}</p>
+                    <p className="text-sm text-gray-600">CPF: {cliente.cpf} · {cliente.telefone}</p>
+                  </button>
+                ))}
+              </div>
+            )}
           </CardContent>
         </Card>
 
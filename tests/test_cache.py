@@ -0,0 +1,52 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'backend'))
+
+from cache import ResponseCache
+
+
+def test_write_during_slow_compute_is_not_joined():
+    async def run():
+        response_cache = ResponseCache()
+        nome = {'value': 'antigo'}
+        started = asyncio.Event()
+
+        async def compute():
+            lido = nome['value']
+            started.set()
+            await asyncio.sleep(0.05)
+            return lido
+
+        antes = asyncio.create_task(response_cache.get_or_compute('vestidos', ['vestidos'], compute))
+        await started.wait()
+        # A write commits and invalidates while the first computation is running
+        nome['value'] = 'novo'
+        response_cache.invalidate('vestidos')
+        depois = await response_cache.get_or_compute('vestidos', ['vestidos'], compute)
+
+        assert await antes == 'antigo'
+        assert depois == 'novo'
+        # Only the computation started after the write is stored
+        assert await response_cache.get_or_compute('vestidos', ['vestidos'], compute) == 'novo'
+        assert response_cache.metrics()['em_andamento'] == 0
+
+    asyncio.run(run())
+
+
+def test_requests_without_a_write_share_one_computation():
+    async def run():
+        response_cache = ResponseCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        results = await asyncio.gather(*(response_cache.get_or_compute('k', ['t'], compute) for _ in range(5)))
+        assert results == [1] * 5
+        assert len(calls) == 1
+
+    asyncio.run(run())